@@ -0,0 +1,230 @@
+import os
+import struct
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+from engines import IMAGE_EXTENSIONS
+
+# Background and object libraries can be far bigger than the memory of the container, so at startup
+# only the file names, sizes and image dimensions (read from the file headers) are collected. The
+# images themselves are decoded when they are first used and kept in an LRU cache with a memory
+# budget. Uncompressed BMPs can optionally be memory-mapped instead of decoded.
+#
+# A file is identified by its path, modification time and size (its version), so when the same
+# process runs several jobs (see server.py) a changed file is read again instead of served from
+# the caches.
+
+# Image dimensions by file version, so scanning a folder again only reads the headers of new files
+_image_sizes = {}
+
+class Asset:
+    def __init__(self, path, label=None, stat=None):
+        self.path = path
+        self.filename = os.path.basename(path)
+        self.label = label
+        if stat is None:
+            stat = os.stat(path)
+        self.file_size = stat.st_size
+        self.version = (path, stat.st_mtime_ns, stat.st_size)
+        size = _image_sizes.get(self.version)
+        if size is None:
+            size = read_image_size(path)
+            if size[0] is not None:
+                _image_sizes[self.version] = size
+        self.width, self.height = size
+
+def scan_assets(directory, labels=None, label_from_filename=False):
+    # Sorted so the same seed picks the same images whatever order the filesystem lists them in
+    assets = []
+    for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+        filename = entry.name
+        if not filename.endswith(IMAGE_EXTENSIONS):
+            continue
+        label = None
+        if label_from_filename:
+            # The label is the image filename before the first underscore
+            label = filename.split('_')[0]
+            if labels is not None and labels != ['all'] and label not in labels:
+                continue
+        assets.append(Asset(entry.path, label, entry.stat()))
+    return assets
+
+# Read the image dimensions from the file header, returns (None, None) if the format isn't recognised
+def read_image_size(path):
+    with open(path, 'rb') as f:
+        header = f.read(32)
+        if header[:8] == b'\x89PNG\r\n\x1a\n' and header[12:16] == b'IHDR':
+            return struct.unpack('>II', header[16:24])
+        if header[:2] == b'BM':
+            width, height = struct.unpack_from('<ii', header, 18)
+            return width, abs(height)
+        if header[:2] == b'\xff\xd8':
+            # Walk the JPEG markers until the start of frame
+            f.seek(2)
+            while True:
+                marker = f.read(2)
+                if len(marker) < 2 or marker[0] != 0xFF:
+                    break
+                if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:
+                    continue
+                length = struct.unpack('>H', f.read(2))[0]
+                if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+                    height, width = struct.unpack('>xHH', f.read(5))
+                    return width, height
+                f.seek(length - 2, os.SEEK_CUR)
+    return None, None
+
+class MappedBMP:
+    # A read-only BMP memory-mapped as a (height, width, channels) BGR(A) array, the pixels are
+    # only read from disk when the image is used
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            header = f.read(70)
+        pixel_offset, header_size = struct.unpack_from('<II', header, 10)
+        width, height, planes, bits, compression = struct.unpack_from('<iiHHI', header, 18)
+        if bits == 24 and compression == 0:
+            channels = 3
+            self.has_alpha = False
+        elif bits == 32 and compression in (0, 3):
+            channels = 4
+            self.has_alpha = False
+            if compression == 3:
+                # Only the standard BGRA bit layout can be mapped directly
+                masks = struct.unpack_from('<IIII', header, 54)
+                if header_size < 56 or masks != (0x00FF0000, 0x0000FF00, 0x000000FF, 0xFF000000):
+                    raise ValueError('Unsupported BMP bit fields')
+                self.has_alpha = True
+        else:
+            raise ValueError('Unsupported BMP format (' + str(bits) + ' bits, compression ' + str(compression) + ')')
+        self.bottom_up = height > 0
+        height = abs(height)
+        row_bytes = (width * channels + 3) // 4 * 4
+        data = np.memmap(path, dtype=np.uint8, mode='r', offset=pixel_offset, shape=(height * row_bytes,))
+        self.pixels = np.ndarray((height, width, channels), dtype=np.uint8, buffer=data, strides=(row_bytes, channels, 1))
+        self.shape = (height, width, 4)
+        self.nbytes = 0
+
+    def to_rgba(self):
+        if self.pixels.shape[2] == 3:
+            rgba = cv2.cvtColor(self.pixels, cv2.COLOR_BGR2RGBA)
+        else:
+            rgba = cv2.cvtColor(self.pixels, cv2.COLOR_BGRA2RGBA)
+            if not self.has_alpha:
+                rgba[:, :, 3] = 255
+        if self.bottom_up:
+            rgba = cv2.flip(rgba, 0)
+        return rgba
+
+class ImageCache:
+    # LRU cache of decoded images, limited by the (estimated) memory they use
+    def __init__(self, engine, max_size_mb=2048, mmap_bmp=False):
+        self.engine = engine
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self.mmap_bmp = mmap_bmp
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._images = OrderedDict()
+        # Images shared with other processes (see share), they're neither counted nor evicted
+        self._shared = {}
+
+    def get(self, asset):
+        entry = self._shared.get(asset.path)
+        if entry is not None and entry[2] == asset.version:
+            self.hits += 1
+            return entry[0]
+        entry = self._images.get(asset.path)
+        if entry is not None:
+            if entry[2] == asset.version:
+                self._images.move_to_end(asset.path)
+                self.hits += 1
+                return entry[0]
+            # The file changed since it was decoded
+            del self._images[asset.path]
+            self.used_bytes -= entry[1]
+
+        self.misses += 1
+        image = self.map_bmp(asset)
+        if image is None:
+            image = self.engine.load(asset.path)
+        if asset.width is None:
+            asset.width, asset.height = self.engine.size(image)
+
+        size = self.engine.memory_size(image)
+        self._images[asset.path] = (image, size, asset.version)
+        self.used_bytes += size
+        # Drop the least recently used images, but always keep the one that was just loaded
+        while self.used_bytes > self.max_bytes and len(self._images) > 1:
+            _, (_, evicted_size, _) = self._images.popitem(last=False)
+            self.used_bytes -= evicted_size
+            self.evicted += 1
+        return image
+
+    def map_bmp(self, asset):
+        # The image memory-mapped, or None if it isn't (--mmap-bmp is off, or it isn't a BMP that can be mapped)
+        if not (self.mmap_bmp and asset.path.endswith('.bmp') and self.engine.name == 'numpy'):
+            return None
+        try:
+            return MappedBMP(asset.path)
+        except ValueError:
+            return None
+
+    def peek(self, asset):
+        # The cached image, or None if it isn't cached (doesn't load the image or count as a use)
+        for images in (self._shared, self._images):
+            entry = images.get(asset.path)
+            if entry is not None and entry[2] == asset.version:
+                return entry[0]
+        return None
+
+    def share(self, max_bytes):
+        # Called in a forked worker process: the images decoded so far are shared with the main
+        # process, so they're kept without counting them, and the worker decodes the rest within
+        # max_bytes
+        self._shared.update(self._images)
+        self._images = OrderedDict()
+        self.used_bytes = 0
+        self.max_bytes = max_bytes
+
+    def preload(self, assets):
+        # Decode the assets until the memory budget is full, so processes forked afterwards share them
+        for asset in assets:
+            evicted = self.evicted
+            self.get(asset)
+            if self.evicted > evicted:
+                # Something was evicted to make room, the cache is full
+                break
+
+class VariantCache:
+    # LRU cache of images derived from assets (e.g. blurred backgrounds), limited by the memory they
+    # use. Keys should include the asset version, so variants of changed files are made again
+    def __init__(self, engine, max_size_mb=1024):
+        self.engine = engine
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._images = OrderedDict()
+
+    def get(self, key, render):
+        # Returns the cached image for key, or the result of render() (which is then cached). The
+        # returned image is shared, callers must not change it
+        entry = self._images.get(key)
+        if entry is not None:
+            self._images.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        image = render()
+        size = self.engine.memory_size(image)
+        if size > self.max_bytes:
+            return image
+        self._images[key] = (image, size)
+        self.used_bytes += size
+        while self.used_bytes > self.max_bytes:
+            _, (_, evicted_size) = self._images.popitem(last=False)
+            self.used_bytes -= evicted_size
+        return image
@@ -0,0 +1,102 @@
+import math
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+# Object variant atlas. Rotating and motion blurring every placed object is the most expensive part
+# of building a composite, so with --atlas-angles every object is rendered up front at that many
+# evenly spaced rotation angles, times every motion blur setting an image can draw (8 sigmas for
+# each direction). Variants are trimmed to the bounding box of their visible pixels, and during
+# generation a random angle bucket is picked instead of a random angle. Fewer angle buckets build
+# faster and take less memory, but give less variety.
+#
+# The memory the atlas would need is estimated before rendering, if it doesn't fit in the budget
+# the number of angles is reduced until it does (or the atlas isn't used at all).
+
+log = logging.getLogger(__name__)
+
+# Motion blur sigmas, an image draws randrange(8)
+BLUR_SIGMAS = range(8)
+
+def atlas_angles(count):
+    return [index * 360 / count for index in range(count)]
+
+def rotated_size(width, height, angle):
+    radians = math.radians(angle)
+    cos, sin = abs(math.cos(radians)), abs(math.sin(radians))
+    return int(round(width * cos + height * sin)), int(round(width * sin + height * cos))
+
+class ObjectAtlas:
+    def __init__(self, engine, angles, blurs):
+        # angles is a list of rotation angles ([None] without rotation), blurs a list of
+        # (sigma, direction) ([None] without motion blur)
+        self.engine = engine
+        self.angles = angles
+        self.blurs = blurs
+        self.used_bytes = 0
+        self._variants = {}
+
+    def estimate_size(self, assets):
+        # Upper bound of the memory used by all variants (before they're trimmed)
+        total = 0
+        for asset in assets:
+            for angle in self.angles:
+                width, height = rotated_size(asset.width, asset.height, angle or 0)
+                total += width * height * self.engine.pixel_bytes * len(self.blurs)
+        return total
+
+    def _render(self, asset, image, angle_index):
+        engine = self.engine
+        rotated = engine.clone(image)
+        angle = self.angles[angle_index]
+        if angle is not None:
+            rotated = engine.rotate(rotated, angle)
+        variants = {}
+        for blur in self.blurs:
+            variant = engine.clone(rotated)
+            if blur is not None:
+                variant = engine.motion_blur(variant, blur[0], blur[1])
+            variants[(asset.path, angle_index, blur)] = engine.trim_alpha(variant)
+        return variants
+
+    def build(self, assets, images, threads=None):
+        # Source images are fetched up front, the image cache isn't thread safe
+        sources = [(asset, images.get(asset)) for asset in assets]
+        work = [(asset, image, angle_index) for asset, image in sources for angle_index in range(len(self.angles))]
+        # cv2 and ImageMagick release the GIL, so the variants are rendered on a thread pool
+        with ThreadPoolExecutor(max_workers=threads or os.cpu_count()) as executor:
+            for variants in executor.map(lambda item: self._render(*item), work):
+                for key, variant in variants.items():
+                    self._variants[key] = variant
+                    self.used_bytes += self.engine.memory_size(variant)
+
+    def get(self, asset, angle_index, blur):
+        # The returned image is shared, callers have to clone it before changing it
+        return self._variants[(asset.path, angle_index, blur)]
+
+    def __len__(self):
+        return len(self._variants)
+
+def build_atlas(engine, images, assets, angle_count, blurs, max_size_mb, rotate=True):
+    # Returns the atlas with as many of the angle_count angles as fit in max_size_mb, or None if
+    # even a single angle doesn't fit
+    max_bytes = max_size_mb * 1024 * 1024
+    start = time.time()
+    atlas = None
+    for count in range(angle_count if rotate else 1, 0, -1):
+        candidate = ObjectAtlas(engine, atlas_angles(count) if rotate else [None], blurs)
+        estimate = candidate.estimate_size(assets)
+        if estimate <= max_bytes:
+            atlas = candidate
+            break
+    if atlas is None:
+        log.warning(f'Object atlas does not fit in {max_size_mb} MB (needs {estimate / 1024 / 1024:.1f} MB for a single angle), rendering objects live')
+        return None
+    if rotate and len(atlas.angles) < angle_count:
+        log.warning(f'Object atlas reduced from {angle_count} to {len(atlas.angles)} angles to fit in {max_size_mb} MB')
+
+    atlas.build(assets, images)
+    log.info(f'Object atlas: {len(atlas)} variants of {len(assets)} objects ({len(atlas.angles)} angles x {len(blurs)} blur settings), '
+             f'{atlas.used_bytes / 1024 / 1024:.1f} MB, built in {time.time() - start:.2f}s')
+    return atlas
@@ -0,0 +1,155 @@
+import os, sys
+import argparse
+import itertools
+import json
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import cv2
+
+from engines import IMAGE_EXTENSIONS
+
+# Benchmarks transform.py on the bundled composites/ and raw_objects/ fixtures (uploads are always
+# skipped). Every combination of engine, image count, object count and resolution is run as a
+# separate job, and the time spent in each stage (from --stage-timings) is written to a JSON file.
+# Pass a previous results file with --compare to see how much faster or slower each run got.
+#
+#     python3 benchmark.py --images 10,50 --objects 5,20 --scales 1,4 --output bench.json
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+parser = argparse.ArgumentParser(description='Benchmark the composite image generation pipeline')
+parser.add_argument('--engines', type=str, required=False, help="Comma-separated list of engines to benchmark", default='numpy')
+parser.add_argument('--images', type=str, required=False, help="Comma-separated list of image counts", default='10')
+parser.add_argument('--objects', type=str, required=False, help="Comma-separated list of (maximum) object counts per image", default='5')
+parser.add_argument('--scales', type=str, required=False, help="Comma-separated list of factors to scale the fixture backgrounds and objects by", default='1')
+parser.add_argument('--allow-overlap', type=int, required=False, help="Whether objects are allowed to overlap", default=0)
+parser.add_argument('--apply-motion-blur', type=int, required=False, help="Whether to apply motion blur", default=1)
+parser.add_argument('--apply-fisheye', type=int, required=False, help="Whether to apply the fisheye lens effect", default=1)
+parser.add_argument('--remove-background', type=int, required=False, help="If set to 1, also benchmarks rembg on raw_objects/ (needs rembg installed)", default=0)
+parser.add_argument('--workers', type=int, required=False, help="Number of worker processes for each run", default=1)
+parser.add_argument('--extra-args', type=str, required=False, help="Extra arguments to pass to transform.py", default='')
+parser.add_argument('--output', type=str, required=False, help="JSON file to write the results to", default='bench_output.json')
+parser.add_argument('--compare', type=str, required=False, help="Previous results file to compare against")
+args = parser.parse_args()
+
+def int_list(value):
+    return [int(v) for v in value.split(',')]
+
+def float_list(value):
+    return [float(v) for v in value.split(',')]
+
+# Copy the fixtures, scaling every image by the given factor
+def make_fixtures(directory, scale):
+    for folder in ('background', 'object'):
+        src_dir = os.path.join(REPO_DIR, 'composites', folder)
+        dst_dir = os.path.join(directory, 'composites', folder)
+        os.makedirs(dst_dir)
+        for filename in sorted(os.listdir(src_dir)):
+            if not filename.endswith(IMAGE_EXTENSIONS):
+                continue
+            if scale == 1:
+                shutil.copy(os.path.join(src_dir, filename), dst_dir)
+                continue
+            image = cv2.imread(os.path.join(src_dir, filename), cv2.IMREAD_UNCHANGED)
+            image = cv2.resize(image, (int(image.shape[1] * scale), int(image.shape[0] * scale)), interpolation=cv2.INTER_CUBIC)
+            # Write as PNG, OpenCV can't write BMPs with an alpha channel
+            cv2.imwrite(os.path.join(dst_dir, os.path.splitext(filename)[0] + '.png'), image)
+
+def run(engine, images, objects, scale, remove_background):
+    with tempfile.TemporaryDirectory() as directory:
+        make_fixtures(directory, scale)
+        timings_path = os.path.join(directory, 'timings.json')
+        command = [sys.executable, os.path.join(REPO_DIR, 'transform.py'),
+            '--composite-dir', os.path.join(directory, 'composites'),
+            '--remove-background', str(remove_background),
+            '--raw-object-dir', os.path.join(REPO_DIR, 'raw_objects'),
+            '--resize-raw-objects', 'custom-scaling-factor',
+            '--custom-raw-resize-scaling-factor', str(0.1 * scale),
+            '--rembg-cache-size', '0',
+            '--labels', 'all',
+            '--images', str(images),
+            '--min-objects', str(objects),
+            '--objects', str(objects),
+            '--allow-overlap', str(args.allow_overlap),
+            '--allow-rotate', '1',
+            '--apply-motion-blur', str(args.apply_motion_blur),
+            '--object-area', '-1',
+            '--crop-object-outside-area', '1',
+            '--apply-fisheye', str(args.apply_fisheye),
+            '--apply-fisheye-all-layers', '1',
+            '--crop-fisheye', '1',
+            '--engine', engine,
+            '--workers', str(args.workers),
+            '--seed', '0',
+            '--skip-upload', '1',
+            '--out-directory', os.path.join(directory, 'output'),
+            '--stage-timings', timings_path] + args.extra_args.split()
+        env = dict(os.environ)
+        env.setdefault('EI_PROJECT_API_KEY', 'benchmark')
+
+        start = time.perf_counter()
+        res = subprocess.run(command, cwd=directory, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        wall_seconds = time.perf_counter() - start
+        if res.returncode != 0:
+            print(res.stdout.decode('utf-8'))
+            raise Exception('Benchmark run failed (exit code ' + str(res.returncode) + ')')
+        with open(timings_path, 'r') as f:
+            timings = json.load(f)
+
+    return {
+        'engine': engine,
+        'images': images,
+        'objects': objects,
+        'scale': scale,
+        'remove_background': remove_background,
+        'wall_seconds': wall_seconds,
+        'images_per_second': images / timings['total_seconds'],
+        'total_seconds': timings['total_seconds'],
+        'stages': timings['stages'],
+    }
+
+def run_key(run):
+    return (run['engine'], run['images'], run['objects'], run['scale'])
+
+runs = []
+combinations = list(itertools.product(args.engines.split(','), int_list(args.images), int_list(args.objects), float_list(args.scales)))
+for n, (engine, images, objects, scale) in enumerate(combinations):
+    remove_background = args.remove_background if n == 0 else 0
+    print(f'[{n+1}/{len(combinations)}] engine={engine} images={images} objects={objects} scale={scale}', end='', flush=True)
+    result = run(engine, images, objects, scale, remove_background)
+    runs.append(result)
+    stages = ', '.join(f'{name}={stage["seconds"]:.2f}s' for name, stage in sorted(result['stages'].items()))
+    print(f' {result["total_seconds"]:.2f}s ({result["images_per_second"]:.1f} images/s): {stages}')
+
+results = {
+    'version': 1,
+    'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    'machine': {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    },
+    'args': vars(args),
+    'runs': runs,
+}
+with open(args.output, 'w') as f:
+    json.dump(results, f, indent=4)
+print('Results written to', args.output)
+
+if args.compare:
+    with open(args.compare, 'r') as f:
+        previous = { run_key(run): run for run in json.load(f)['runs'] }
+    print('')
+    print('Compared to', args.compare, '(time relative to the previous run, lower is faster):')
+    for run in runs:
+        before = previous.get(run_key(run))
+        if before is None:
+            continue
+        print(f'  engine={run["engine"]} images={run["images"]} objects={run["objects"]} scale={run["scale"]}: '
+              f'total {run["total_seconds"] / before["total_seconds"]:.2f}x')
+        for name, stage in sorted(run['stages'].items()):
+            if name in before['stages'] and before['stages'][name]['seconds'] > 0:
+                print(f'    {name}: {stage["seconds"] / before["stages"][name]["seconds"]:.2f}x')
@@ -0,0 +1,83 @@
+import numpy as np
+
+# Bounding boxes of the objects in an image. All boxes of an image are kept in one structured
+# array, so transforms (fisheye, cropping, clipping) work on every box at once, and they're only
+# turned into Edge Impulse label JSON when the labels are written or uploaded.
+
+BOX_DTYPE = np.dtype([('label', np.int32), ('x', np.int32), ('y', np.int32), ('width', np.int32), ('height', np.int32)])
+
+def make_boxes(rows=()):
+    # rows are (label id, x, y, width, height) tuples
+    return np.array(list(rows), dtype=BOX_DTYPE)
+
+def edge_points(boxes, samples):
+    # Points along the edges of every box, an array of shape (boxes, 4 * samples, 2). The first point
+    # of each edge is a corner, so with a single sample these are the four corners
+    t = np.arange(samples, dtype=np.float32)[None, :] / samples
+    x = boxes['x'][:, None].astype(np.float32)
+    y = boxes['y'][:, None].astype(np.float32)
+    w = boxes['width'][:, None].astype(np.float32)
+    h = boxes['height'][:, None].astype(np.float32)
+    same = np.zeros_like(t)
+    # Clockwise from the top left corner: top, right, bottom and left edge
+    xs = np.concatenate([x + t * w, x + w + same, x + w - t * w, x + same], axis=1)
+    ys = np.concatenate([y + same, y + t * h, y + h + same, y + h - t * h], axis=1)
+    return np.stack([xs, ys], axis=2)
+
+def boxes_from_points(labels, points):
+    # Boxes around each set of points (an array of shape (boxes, points, 2))
+    low = points.min(axis=1)
+    high = points.max(axis=1)
+    boxes = np.empty(len(labels), dtype=BOX_DTYPE)
+    boxes['label'] = labels
+    boxes['x'] = low[:, 0]
+    boxes['y'] = low[:, 1]
+    boxes['width'] = high[:, 0] - low[:, 0]
+    boxes['height'] = high[:, 1] - low[:, 1]
+    return boxes
+
+def intersect_boxes(boxes, left, top, right, bottom):
+    # Every box intersected with the rectangle, boxes outside it end up with a width or height of 0
+    x1 = np.maximum(boxes['x'], left)
+    y1 = np.maximum(boxes['y'], top)
+    x2 = np.minimum(boxes['x'] + boxes['width'], right)
+    y2 = np.minimum(boxes['y'] + boxes['height'], bottom)
+    clipped = np.empty(len(boxes), dtype=BOX_DTYPE)
+    clipped['label'] = boxes['label']
+    clipped['x'] = x1
+    clipped['y'] = y1
+    clipped['width'] = np.maximum(x2 - x1, 0)
+    clipped['height'] = np.maximum(y2 - y1, 0)
+    return clipped
+
+def clip_boxes(boxes, left, top, right, bottom):
+    # Intersect every box with the rectangle, boxes that end up empty are dropped
+    clipped = intersect_boxes(boxes, left, top, right, bottom)
+    return clipped[(clipped['width'] > 0) & (clipped['height'] > 0)]
+
+def crop_boxes(boxes, x, y, width, height, out_width, out_height, min_visibility=0.0):
+    # The boxes in the region (x, y, width, height) of an image, in the coordinates of that region
+    # resized to out_width x out_height. Boxes with less than min_visibility of their area inside
+    # the region are dropped
+    clipped = intersect_boxes(boxes, x, y, x + width, y + height)
+    area = boxes['width'].astype(np.int64) * boxes['height']
+    visible = clipped['width'].astype(np.int64) * clipped['height']
+    clipped = clipped[(visible > 0) & (visible >= min_visibility * area)]
+    scale_x, scale_y = out_width / width, out_height / height
+    x1 = np.rint((clipped['x'] - x) * scale_x)
+    y1 = np.rint((clipped['y'] - y) * scale_y)
+    x2 = np.rint((clipped['x'] + clipped['width'] - x) * scale_x)
+    y2 = np.rint((clipped['y'] + clipped['height'] - y) * scale_y)
+    cropped = np.empty(len(clipped), dtype=BOX_DTYPE)
+    cropped['label'] = clipped['label']
+    cropped['x'] = x1
+    cropped['y'] = y1
+    cropped['width'] = x2 - x1
+    cropped['height'] = y2 - y1
+    # Boxes that got too small to see when downscaling
+    return cropped[(cropped['width'] > 0) & (cropped['height'] > 0)]
+
+def boxes_to_objects(boxes, label_names):
+    # Edge Impulse bounding box labels
+    return [{ 'label': label_names[label], 'x': int(x), 'y': int(y), 'width': int(width), 'height': int(height) }
+            for label, x, y, width, height in boxes.tolist()]
@@ -0,0 +1,134 @@
+import sys
+import json
+
+from ingestion import Uploader, get_ingestion_url
+from ingestion_server import IngestionStandIn
+
+# Checks the upload stage (ingestion.py) against the local ingestion stand-in (ingestion_server.py):
+# retries on 429/5xx, matching the entries of a batch response to files (by name and by position),
+# and retrying the files that failed in a batch on their own. Exits with 1 if a check fails.
+#
+#     python3 check_ingestion.py
+
+failures = []
+
+def check(name, ok, details=''):
+    print(('OK   ' if ok else 'FAIL ') + name + ('' if ok else ': ' + str(details)))
+    if not ok:
+        failures.append(name)
+
+def run_uploads(stand_in, files, batch_size=1, max_retries=3):
+    # Uploads files (a list of (filename, objects)) through a single upload thread, returns the
+    # uploader and the files it reported as uploaded
+    uploaded = []
+    uploader = Uploader(get_ingestion_url(stand_in.host), 'test-key', 'training', { 'generated_by': 'check_ingestion' },
+                        concurrency=1, batch_size=batch_size, max_retries=max_retries, backoff=0.01, timeout=10,
+                        on_uploaded=uploaded.append)
+    for filename, objects in files:
+        uploader.submit(filename, None, objects, b'image data of ' + filename.encode('utf-8'))
+    uploader.close()
+    return uploader, uploaded
+
+def make_files(count):
+    return [(f'composite.{i}.png', [{ 'label': 'nut', 'x': i, 'y': 0, 'width': 10, 'height': 10 }]) for i in range(count)]
+
+def check_retries():
+    # Rate limits and server errors are retried, Retry-After is respected
+    for status in (429, 500, 503):
+        stand_in = IngestionStandIn().start()
+        stand_in.statuses = [status, status]
+        stand_in.retry_after = 0
+        files = make_files(1)
+        uploader, uploaded = run_uploads(stand_in, files)
+        stand_in.stop()
+        check(f'{status} is retried', uploaded == ['composite.0.png'] and uploader.retries == 2 and len(uploader.failed) == 0,
+              (uploaded, uploader.retries, uploader.failed))
+        check(f'labels are sent with the file after a {status}', stand_in.uploads.get('composite.0.png') == files[0][1], stand_in.uploads)
+
+def check_retries_exhausted():
+    # A file that keeps hitting server errors fails after max_retries retries, without stopping the others
+    stand_in = IngestionStandIn().start()
+    stand_in.statuses = [503] * 3
+    uploader, uploaded = run_uploads(stand_in, make_files(2), max_retries=2)
+    stand_in.stop()
+    check('a file fails after max_retries', [filename for filename, _ in uploader.failed] == ['composite.0.png'], uploader.failed)
+    check('later files are still uploaded', uploaded == ['composite.1.png'], uploaded)
+
+def check_permanent_errors():
+    # Anything that isn't a 429/5xx isn't retried
+    stand_in = IngestionStandIn().start()
+    stand_in.statuses = [400]
+    uploader, uploaded = run_uploads(stand_in, make_files(1))
+    stand_in.stop()
+    check('a 400 is not retried', len(stand_in.requests) == 1 and uploader.retries == 0 and len(uploader.failed) == 1,
+          (stand_in.requests, uploader.failed))
+
+def check_batch(file_names):
+    # Every entry of a batch response is checked, failed files are retried on their own
+    stand_in = IngestionStandIn().start()
+    stand_in.file_names = file_names
+    stand_in.fail_files = { 'composite.1.png': 1 }
+    files = make_files(3)
+    uploader, uploaded = run_uploads(stand_in, files, batch_size=3)
+    stand_in.stop()
+    matched = 'by name' if file_names else 'by position'
+    batch = stand_in.requests[0]
+    check(f'files are sent in one batch ({matched})', batch['files'] == ['composite.0.png', 'composite.1.png', 'composite.2.png', 'bounding_boxes.labels'],
+          batch['files'])
+    check(f'the batch carries the labels manifest ({matched})', all(stand_in.uploads.get(filename) == objects for filename, objects in files if filename != 'composite.1.png'),
+          stand_in.uploads)
+    retried = [request['files'] for request in stand_in.requests[1:]]
+    check(f'only the failed file is retried on its own ({matched})', retried == [['composite.1.png']], retried)
+    check(f'all files end up uploaded ({matched})', sorted(uploaded) == [filename for filename, _ in files] and len(uploader.failed) == 0,
+          (uploaded, uploader.failed))
+    check(f'the retried file has its labels ({matched})', stand_in.uploads.get('composite.1.png') == files[1][1], stand_in.uploads)
+
+def check_batch_retries():
+    # A batch that hits a server error is retried as a whole, and falls back to uploading the files
+    # one by one when it keeps failing
+    stand_in = IngestionStandIn().start()
+    stand_in.statuses = [503]
+    uploader, uploaded = run_uploads(stand_in, make_files(2), batch_size=2)
+    stand_in.stop()
+    check('a failed batch is retried as a whole', [len(request['files']) for request in stand_in.requests] == [3, 3], stand_in.requests)
+    check('the retried batch is uploaded', sorted(uploaded) == ['composite.0.png', 'composite.1.png'] and uploader.retries == 1, (uploaded, uploader.retries))
+
+    stand_in = IngestionStandIn().start()
+    stand_in.statuses = [503, 503]
+    uploader, uploaded = run_uploads(stand_in, make_files(2), batch_size=2, max_retries=1)
+    stand_in.stop()
+    check('a batch that keeps failing is uploaded one by one', [len(request['files']) for request in stand_in.requests] == [3, 3, 1, 1], stand_in.requests)
+    check('the files are uploaded after the batch failed', sorted(uploaded) == ['composite.0.png', 'composite.1.png'], uploaded)
+
+def check_missing_entries():
+    # A file the service doesn't mention in its response counts as failed and is retried on its own
+    stand_in = IngestionStandIn().start()
+    original = stand_in._handle
+
+    def drop_last_entry(path, headers, body):
+        status, extra, out = original(path, headers, body)
+        if status == 200 and len(stand_in.requests) == 1:
+            response = json.loads(out)
+            response['files'] = response['files'][:-1]
+            out = json.dumps(response).encode('utf-8')
+        return status, extra, out
+    stand_in._handle = drop_last_entry
+    uploader, uploaded = run_uploads(stand_in, make_files(2), batch_size=2)
+    stand_in.stop()
+    retried = [request['files'] for request in stand_in.requests[1:]]
+    check('a file missing from the response is retried on its own', retried == [['composite.1.png']], retried)
+    check('the missing file is uploaded', sorted(uploaded) == ['composite.0.png', 'composite.1.png'], uploaded)
+
+check_retries()
+check_retries_exhausted()
+check_permanent_errors()
+check_batch(file_names=True)
+check_batch(file_names=False)
+check_batch_retries()
+check_missing_entries()
+
+print('')
+if len(failures) > 0:
+    print(f'{len(failures)} checks failed')
+    sys.exit(1)
+print('All checks passed')
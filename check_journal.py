@@ -0,0 +1,76 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+
+import generator
+from journal import LabelJournal, read_journal, JOURNAL_FILENAME, LABELS_FILENAME
+
+# Checks that a job resumes (--resume) from a journal whose last line was cut off when the job died:
+# the cut off line is dropped and the lines written after it are all read back. Exits with 1 if a
+# check fails.
+#
+#     python3 check_journal.py
+
+failures = []
+
+def check(name, ok, details=''):
+    print(('OK   ' if ok else 'FAIL ') + name + ('' if ok else ': ' + str(details)))
+    if not ok:
+        failures.append(name)
+
+def cut_journal(directory, count):
+    # Cuts the last count bytes off the journal, like a job that died halfway through writing a line
+    path = os.path.join(directory, JOURNAL_FILENAME)
+    with open(path, 'rb+') as f:
+        f.truncate(f.seek(0, os.SEEK_END) - count)
+
+def check_journal():
+    directory = tempfile.mkdtemp(prefix='check-journal-')
+    try:
+        journal = LabelJournal(directory)
+        journal.open({ 'epoch': 1, 'seed': 1, 'settings': 'x' })
+        for i in range(3):
+            journal.image(i, [(f'composite.1.{i}.png', [{ 'label': 'nut', 'x': i, 'y': 0, 'width': 10, 'height': 10 }])])
+        journal.close()
+        cut_journal(directory, 10)
+
+        journal = LabelJournal(directory)
+        journal.open()
+        journal.image(3, [('composite.1.3.png', [])])
+        journal.uploaded('composite.1.0.png')
+        journal.close()
+        state = read_journal(journal.path)
+        check('the cut off line is dropped', sorted(state.images) == [0, 1, 3], sorted(state.images))
+        check('lines after the cut off line are read', state.uploaded == { 'composite.1.0.png' }, state.uploaded)
+    finally:
+        shutil.rmtree(directory)
+
+def check_resume():
+    directory = tempfile.mkdtemp(prefix='check-journal-')
+    argv = ['--composite-dir', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'composites'), '--remove-background', '0',
+            '--labels', 'all', '--min-objects', '1', '--objects', '3', '--allow-overlap', '1', '--allow-rotate', '0',
+            '--apply-motion-blur', '0', '--object-area', '-1', '--crop-object-outside-area', '0', '--apply-fisheye', '0',
+            '--engine', 'numpy', '--seed', '1', '--skip-upload', '1', '--out-directory', directory]
+    try:
+        generator.generate(generator.parse_config(argv + ['--images', '5']))
+        cut_journal(directory, 30)
+        generator.generate(generator.parse_config(argv + ['--images', '6', '--resume', '1']))
+
+        with open(os.path.join(directory, LABELS_FILENAME), 'r') as f:
+            labels = json.load(f)['boundingBoxes']
+        written = sorted(filename for filename in os.listdir(directory) if filename.startswith('composite.'))
+        check('every image on disk has labels after resuming', sorted(labels) == written, (sorted(labels), written))
+        check('every image is done after resuming', sorted(int(filename.split('.')[2]) for filename in labels) == list(range(6)), sorted(labels))
+    finally:
+        shutil.rmtree(directory)
+
+check_journal()
+check_resume()
+
+print('')
+if len(failures) > 0:
+    print(f'{len(failures)} checks failed')
+    sys.exit(1)
+print('All checks passed')
@@ -0,0 +1,280 @@
+import math
+import cv2
+import numpy as np
+
+# Image engines used by transform.py to build the composites. Both engines expose the same
+# operations so the generation loop (and the random numbers it draws) is identical whichever
+# engine is used, which keeps the label geometry the same between them.
+#
+# Operations that change an image return the changed image, callers must always use the
+# returned value (the Wand engine changes images in place, the numpy engine returns new arrays).
+
+IMAGE_EXTENSIONS = ('.png', '.bmp', '.jpg', '.jpeg')
+
+class WandEngine:
+    name = 'wand'
+    # ImageMagick (Q16) keeps 4 channels of 16 bits per pixel
+    pixel_bytes = 8
+
+    def __init__(self):
+        from wand.image import Image
+        from wand.color import Color
+        self.Image = Image
+        self.Color = Color
+
+    def load(self, path):
+        return self.Image(filename=path)
+
+    def size(self, image):
+        return image.width, image.height
+
+    def clone(self, image):
+        return image.clone()
+
+    def view(self, image):
+        return image
+
+    def memory_size(self, image):
+        return image.width * image.height * self.pixel_bytes
+
+    def new_layer(self, width, height):
+        return self.Image(width=width, height=height, background=self.Color('transparent'))
+
+    def rotate(self, image, angle):
+        image.rotate(angle)
+        return image
+
+    def motion_blur(self, image, sigma, angle):
+        image.motion_blur(sigma=sigma, angle=angle)
+        return image
+
+    def crop(self, image, x, y, width, height):
+        image.crop(x, y, width=width, height=height)
+        return image
+
+    def tile(self, image, x, y, width, height, out_width, out_height):
+        # The region resized to out_width x out_height as a new image, the image isn't changed
+        tile = image[x:x + width, y:y + height]
+        if (width, height) != (out_width, out_height):
+            tile.resize(out_width, out_height)
+        return tile
+
+    def trim_alpha(self, image):
+        # Crop to the bounding box of the visible pixels
+        box = alpha_bbox(np.array(image))
+        if box is None:
+            return image
+        return self.crop(image, *box)
+
+    def composite(self, destination, source, x, y):
+        destination.composite(source, x, y)
+        return destination
+
+    def flatten(self, background, layer):
+        # The layer on top of the background, without changing the background (the layer is used
+        # for the result instead)
+        layer.composite(background, 0, 0, operator='dst_over')
+        if not background.alpha_channel:
+            layer.alpha_channel = 'off'
+        # The layer is a blank image in the build's default depth (16 bits on Q16 builds), the saved
+        # composite should have the background's depth and colorspace like it had before
+        layer.depth = background.depth
+        layer.colorspace = background.colorspace
+        return layer
+
+    def to_array(self, image):
+        return np.array(image)
+
+    def from_array(self, array):
+        return self.Image.from_array(array)
+
+    def encode(self, image, format='png', compression_level=None, quality=90):
+        # Returns the encoded image, changes the image's format settings
+        image.format = 'jpeg' if format == 'jpg' else format
+        if format == 'png':
+            if compression_level is not None:
+                # The tens digit is the zlib level, the ones digit the PNG filter (5 is adaptive)
+                image.compression_quality = compression_level * 10 + 5
+        else:
+            image.compression_quality = quality
+            if format == 'jpg' and image.alpha_channel:
+                image.alpha_channel = 'remove'
+        return image.make_blob()
+
+class NumpyEngine:
+    # Images are RGBA uint8 arrays of shape (height, width, 4)
+    name = 'numpy'
+    pixel_bytes = 4
+
+    def load(self, path):
+        image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if image is None:
+            raise Exception('Failed to load image: ' + path)
+        if image.dtype != np.uint8:
+            image = cv2.convertScaleAbs(image, alpha=255.0 / np.iinfo(image.dtype).max)
+        if image.ndim == 2:
+            return cv2.cvtColor(image, cv2.COLOR_GRAY2RGBA)
+        if image.shape[2] == 3:
+            return cv2.cvtColor(image, cv2.COLOR_BGR2RGBA)
+        return cv2.cvtColor(image, cv2.COLOR_BGRA2RGBA)
+
+    def size(self, image):
+        return image.shape[1], image.shape[0]
+
+    def clone(self, image):
+        # Memory-mapped BMPs (see assets.py) are converted to RGBA when they are cloned
+        if hasattr(image, 'to_rgba'):
+            return image.to_rgba()
+        return image.copy()
+
+    def view(self, image):
+        # An image that can be read but must not be changed, only memory-mapped BMPs need converting
+        if hasattr(image, 'to_rgba'):
+            return image.to_rgba()
+        return image
+
+    def memory_size(self, image):
+        return image.nbytes
+
+    def new_layer(self, width, height):
+        return np.zeros((height, width, 4), dtype=np.uint8)
+
+    def rotate(self, image, angle):
+        # Rotate clockwise (like ImageMagick) and grow the canvas to fit the rotated image
+        height, width = image.shape[:2]
+        radians = math.radians(angle)
+        cos, sin = abs(math.cos(radians)), abs(math.sin(radians))
+        new_width = int(round(width * cos + height * sin))
+        new_height = int(round(width * sin + height * cos))
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), -angle, 1.0)
+        matrix[0, 2] += (new_width - width) / 2
+        matrix[1, 2] += (new_height - height) / 2
+        return cv2.warpAffine(image, matrix, (new_width, new_height), flags=cv2.INTER_LINEAR,
+                              borderMode=cv2.BORDER_CONSTANT, borderValue=(0, 0, 0, 0))
+
+    def motion_blur(self, image, sigma, angle):
+        if sigma <= 0:
+            return image
+        kernel = motion_blur_kernel(sigma, angle)
+        # Blur with premultiplied alpha so transparent pixels don't bleed their colour into the object
+        alpha = image[:, :, 3:].astype(np.float32) / 255
+        premultiplied = image.astype(np.float32)
+        premultiplied[:, :, :3] *= alpha
+        blurred = cv2.filter2D(premultiplied, -1, kernel, borderType=cv2.BORDER_REPLICATE)
+        blurred_alpha = blurred[:, :, 3:] / 255
+        np.divide(blurred[:, :, :3], blurred_alpha, out=blurred[:, :, :3], where=blurred_alpha > 0)
+        return np.clip(blurred + 0.5, 0, 255).astype(np.uint8)
+
+    def crop(self, image, x, y, width, height):
+        return image[y:y + height, x:x + width]
+
+    def tile(self, image, x, y, width, height, out_width, out_height):
+        # The region resized to out_width x out_height, the image isn't changed (an unscaled tile is
+        # a view of it)
+        region = image[y:y + height, x:x + width]
+        if (width, height) == (out_width, out_height):
+            return region
+        interpolation = cv2.INTER_AREA if out_width < width else cv2.INTER_LINEAR
+        return cv2.resize(region, (out_width, out_height), interpolation=interpolation)
+
+    def trim_alpha(self, image):
+        # Crop to the bounding box of the visible pixels (as a copy, so the full image can be freed)
+        box = alpha_bbox(image)
+        if box is None:
+            return image
+        x, y, width, height = box
+        return image[y:y + height, x:x + width].copy()
+
+    def composite(self, destination, source, x, y):
+        # Alpha-blend source over destination at (x, y), clipped to the destination bounds
+        dest_height, dest_width = destination.shape[:2]
+        src_height, src_width = source.shape[:2]
+        left, top = max(x, 0), max(y, 0)
+        right, bottom = min(x + src_width, dest_width), min(y + src_height, dest_height)
+        if right <= left or bottom <= top:
+            return destination
+        region = destination[top:bottom, left:right]
+        alpha_over(source[top - y:bottom - y, left - x:right - x], region, region)
+        return destination
+
+    def flatten(self, background, layer):
+        # The layer on top of the background as a new image, the background isn't changed
+        out = np.empty_like(background)
+        alpha_over(layer, background, out)
+        return out
+
+    def to_array(self, image):
+        return image
+
+    def from_array(self, array):
+        if array.ndim == 2:
+            return cv2.cvtColor(array, cv2.COLOR_GRAY2RGBA)
+        if array.shape[2] == 3:
+            return cv2.cvtColor(array, cv2.COLOR_RGB2RGBA)
+        return np.ascontiguousarray(array)
+
+    def encode(self, image, format='png', compression_level=None, quality=90):
+        # Drop the alpha channel when the image is fully opaque (like ImageMagick does), JPEGs never have one
+        if format == 'jpg' or image[:, :, 3].min() == 255:
+            pixels = cv2.cvtColor(image, cv2.COLOR_RGBA2BGR)
+        else:
+            pixels = cv2.cvtColor(image, cv2.COLOR_RGBA2BGRA)
+        params = []
+        if format == 'png' and compression_level is not None:
+            params = [cv2.IMWRITE_PNG_COMPRESSION, compression_level]
+        elif format == 'jpg':
+            params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        elif format == 'webp':
+            params = [cv2.IMWRITE_WEBP_QUALITY, quality]
+        ok, data = cv2.imencode('.' + format, pixels, params)
+        if not ok:
+            raise Exception('Failed to encode image as ' + format)
+        return data.tobytes()
+
+# Blend src over dst (RGBA arrays of the same size) and write the result to out, which may be dst
+def alpha_over(src, dst, out):
+    src = src.astype(np.float32) / 255
+    dst = dst.astype(np.float32) / 255
+    src_alpha = src[:, :, 3:]
+    dst_alpha = dst[:, :, 3:] * (1 - src_alpha)
+    out_alpha = src_alpha + dst_alpha
+    out_rgb = src[:, :, :3] * src_alpha + dst[:, :, :3] * dst_alpha
+    np.divide(out_rgb, out_alpha, out=out_rgb, where=out_alpha > 0)
+    out[:, :, :3] = np.clip(out_rgb * 255 + 0.5, 0, 255)
+    out[:, :, 3:] = np.clip(out_alpha * 255 + 0.5, 0, 255)
+
+# Bounding box (x, y, width, height) of the pixels that aren't fully transparent in an RGBA array,
+# None if the array has no alpha channel or nothing is visible
+def alpha_bbox(array):
+    if array.ndim < 3 or array.shape[2] < 4:
+        return None
+    visible = array[:, :, 3] > 0
+    columns = np.flatnonzero(visible.any(axis=0))
+    rows = np.flatnonzero(visible.any(axis=1))
+    if len(columns) == 0:
+        return None
+    x, y = int(columns[0]), int(rows[0])
+    return x, y, int(columns[-1]) - x + 1, int(rows[-1]) - y + 1
+
+# Build a one-sided gaussian line kernel, sampling the same pixels as ImageMagick's motion blur
+# (starting at the pixel itself and going out along the blur angle)
+def motion_blur_kernel(sigma, angle):
+    length = int(math.ceil(3 * sigma)) + 1
+    radius = length - 1
+    kernel = np.zeros((2 * radius + 1, 2 * radius + 1), dtype=np.float32)
+    radians = math.radians(angle + 90)
+    for i in range(length):
+        dx = int(round(i * math.sin(radians)))
+        dy = int(round(i * math.cos(radians)))
+        kernel[radius + dy, radius + dx] += math.exp(-(i * i) / (2 * sigma * sigma))
+    return kernel / kernel.sum()
+
+ENGINES = {
+    'wand': WandEngine,
+    'numpy': NumpyEngine,
+}
+
+def get_engine(name):
+    if name not in ENGINES:
+        raise Exception('Invalid engine "' + name + '", should be one of: ' + ', '.join(ENGINES.keys()))
+    return ENGINES[name]()
@@ -0,0 +1,82 @@
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+from boxes import edge_points, boxes_from_points
+
+# Fisheye lens effect. Building the remap tables (and finding the crop box) is much more expensive
+# than the remap itself, and all images of the same size share them, so lenses are cached per
+# (width, height, strength, crop). A long-running process sees many different settings, so only the
+# MAX_LENSES most recently used lenses are kept.
+MAX_LENSES = 16
+_lenses = OrderedDict()
+
+def camera_matrices(width, height, strength):
+    K = np.array([[width, 0, width / 2],
+                  [0, height, height / 2],
+                  [0, 0, 1]], dtype=np.float32)
+    D = np.array([strength, strength, 0, 0], dtype=np.float32)
+    return K, D
+
+class FisheyeLens:
+    def __init__(self, width, height, strength, crop):
+        self.width = width
+        self.height = height
+        self.strength = strength
+        K, D = camera_matrices(width, height, strength)
+        map_x, map_y = cv2.fisheye.initUndistortRectifyMap(K, D, np.eye(3), K, (width, height), cv2.CV_32FC1)
+
+        if crop:
+            # Find the bounding box of the area the source image ends up in (the rest is black)
+            coverage = cv2.remap(np.full((height, width), 255, dtype=np.uint8), map_x, map_y,
+                                 interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+            _, thresh = cv2.threshold(coverage, 1, 255, cv2.THRESH_BINARY)
+            self.crop_box = cv2.boundingRect(thresh)
+        else:
+            self.crop_box = (0, 0, width, height)
+
+        if self.crop_box != (0, 0, width, height):
+            # Fold cropping to the crop box and scaling back to the original size into the remap
+            # tables, so the whole effect is a single remap (sampled like cv2.resize with INTER_LINEAR)
+            x, y, w, h = self.crop_box
+            grid_x = (np.arange(width, dtype=np.float32) + 0.5) * (w / width) - 0.5 + x
+            grid_y = (np.arange(height, dtype=np.float32) + 0.5) * (h / height) - 0.5 + y
+            grid_x, grid_y = np.meshgrid(grid_x, grid_y)
+            map_x = cv2.remap(map_x, grid_x, grid_y, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+            map_y = cv2.remap(map_y, grid_x, grid_y, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+        # Fixed point maps are faster to remap with than float maps
+        self.map1, self.map2 = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+
+    def apply(self, image):
+        return cv2.remap(image, self.map1, self.map2, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+
+def get_lens(width, height, strength=0.5, crop=True):
+    key = (width, height, strength, bool(crop))
+    lens = _lenses.get(key)
+    if lens is None:
+        lens = FisheyeLens(width, height, strength, crop)
+        _lenses[key] = lens
+        if len(_lenses) > MAX_LENSES:
+            _lenses.popitem(last=False)
+    else:
+        _lenses.move_to_end(key)
+    return lens
+
+# Points sampled along every edge of a box. Straight edges come out of the lens curved, so a box
+# around just the four corners can miss the part of an edge that bulges out the most
+EDGE_SAMPLES = 8
+
+# Function to adjust bounding boxes for fisheye effect, boxes is a structured array (see boxes.py).
+# The points of all boxes go through the lens in a single call
+def adjust_boxes(boxes, width, height, crop_box, strength=0.5, samples=EDGE_SAMPLES):
+    if len(boxes) == 0:
+        return boxes
+    K, D = camera_matrices(width, height, strength)
+    points = edge_points(boxes, samples)
+    new_points = cv2.fisheye.undistortPoints(points.reshape(-1, 1, 2), K, D, P=K).reshape(points.shape)
+    if crop_box != (0, 0, width, height):
+        crop_x, crop_y, crop_w, crop_h = crop_box
+        new_points -= np.array([crop_x, crop_y], dtype=np.float32)
+        new_points *= np.array([width / crop_w, height / crop_h], dtype=np.float32)
+    return boxes_from_points(boxes['label'], new_points)
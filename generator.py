@@ -0,0 +1,1037 @@
+import os
+import hashlib
+import argparse
+import json
+import logging
+import time
+import traceback
+import random
+import multiprocessing
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from engines import get_engine, IMAGE_EXTENSIONS
+from rembg_cache import RembgCache
+from assets import scan_assets, ImageCache, VariantCache
+from placement import OccupancyGrid, PlacementStats
+from timing import StageTimer, profile
+from atlas import BLUR_SIGMAS, build_atlas
+from journal import LabelJournal, read_journal, JOURNAL_FILENAME, LABELS_FILENAME
+from shared_assets import SharedAssets
+from boxes import make_boxes, clip_boxes, crop_boxes, boxes_to_objects
+from tiles import parse_tile_size, parse_tile_scales, tile_regions
+
+# The composite image generation pipeline. transform.py is the command line interface, but the
+# pipeline can also be imported and run from a long-lived process, e.g.
+#
+#     import generator
+#     config = generator.parse_config(['--composite-dir', 'composites', '--images', '10', ...])
+#     result = generator.generate(config)
+#
+# Nothing happens at import time, and rembg (onnxruntime), requests (ingestion.py) and the fisheye
+# code are only imported when the options that need them are on. Engines, decoded images, rembg
+# sessions and fisheye lenses are kept at module level, so every job after the first one starts warm.
+#
+# Progress goes to the 'generator', 'atlas' and 'ingestion' loggers at the --log-level of the job,
+# the details of every single object are only logged at 'debug'. transform.py and server.py log the
+# bare messages, when using the generator from Python, set up logging (e.g. logging.basicConfig())
+# to see them.
+
+log = logging.getLogger(__name__)
+# Loggers that follow the --log-level of the job
+LOGGERS = (__name__, 'atlas', 'ingestion')
+
+class GeneratorError(Exception):
+    pass
+
+class ConfigParser(argparse.ArgumentParser):
+    # Raises instead of exiting the process on invalid arguments
+    def error(self, message):
+        raise GeneratorError(self.prog + ': error: ' + message)
+
+def build_parser(exit_on_error=True):
+    parser_class = argparse.ArgumentParser if exit_on_error else ConfigParser
+    parser = parser_class(description='Use OpenAI Dall-E to generate an image dataset for classification from your prompt')
+    parser.add_argument('--composite-dir', type=str, required=True, help="What folder are the source composite images found in? (there should be background and object folders)")
+    parser.add_argument('--remove-background', type=int, required=True, help="Do you have images of your objects which need the background removing?")
+    parser.add_argument('--raw-object-dir', type=str, required=False, help="What folder are the source composite images found in? (there should be background and object folders)")
+    parser.add_argument('--resize-raw-objects', type=str, required=False, help="What method to use to resize the raw object images to match the background images", default='no-resize')
+    parser.add_argument('--custom-raw-resize-pixels', type=str, required=False, help="Comma-separated list of pixel widths for each raw file in the format [filename,width]. By default any non-mentioned labels will not be resized, you can change this by passing [else,75]")
+    parser.add_argument('--custom-raw-resize-scaling-factor', type=float, required=False, help="Scaling factor to apply to all raw object images", default=0.5)
+
+    parser.add_argument('--ignore-already-resized', type=int, required=False, help="If set to 1, will ignore already resized images in the object directory, otherwise they will be done again and overwritten", default=0)
+    parser.add_argument('--rembg-model', type=str, required=False, help="rembg model to remove the background with (e.g. u2net, or u2netp which is faster)", default='u2net')
+    parser.add_argument('--rembg-workers', type=int, required=False, help="Number of raw object images to remove the background from at the same time", default=2)
+    parser.add_argument('--rembg-cache-dir', type=str, required=False, help="Where to cache background removal results between jobs (default: .rembg-cache in the composite directory)")
+    parser.add_argument('--rembg-cache-size', type=float, required=False, help="Maximum size of the background removal cache in MB, least recently used results are removed first (0 to disable the cache)", default=1024)
+
+    parser.add_argument('--labels', type=str, required=True, help="Which objects to generate images for, as a comma-separated list. Set as 'all' to generate images for all objects")
+    parser.add_argument('--images', type=int, required=True, help="Number of images to generate")
+    parser.add_argument('--min-objects', type=int, required=True, help="Minimum number of objects to generate")
+    parser.add_argument('--objects', type=int, required=True, help="Maximum number of objects to generate")
+    parser.add_argument('--allow-overlap', type=int, required=True, help="Whether objects are allowed to overlap")
+    parser.add_argument('--placement-attempts', type=int, required=False, help="How many times to try placing each object when overlap is not allowed", default=10)
+    parser.add_argument('--allow-rotate', type=int, required=True, help="Whether to apply random rotation to objects")
+    parser.add_argument('--apply-motion-blur', type=int, required=True, help="Whether to apply blur to objects to simulate motion")
+    parser.add_argument('--motion-blur-direction', type=int, required=False, help="What direction apply blur to objects to simulate motion (-1 for random)", default=-1)
+    parser.add_argument('--blur-cache-size', type=float, required=False, help="Memory budget in MB for motion blurred backgrounds, so each background is only blurred once for every blur setting, split between the workers (0 blurs every image)", default=1024)
+    parser.add_argument('--object-area', type=str, required=True, help="x1,y1,x2,y2 coordinates of the valid area to place objects in the composite image")
+    parser.add_argument('--crop-object-outside-area', type=int, required=True, help="Whether to crop objects that are placed outside the valid area so they fit in that area")
+    parser.add_argument('--atlas-angles', type=int, required=False, help="If set, every object is rendered up front at this many rotation angles (and every motion blur setting) and sampled from while generating, fewer angles is faster but gives less variety (0 renders every object live)", default=0)
+    parser.add_argument('--atlas-max-mb', type=float, required=False, help="Memory budget in MB for the object atlas, the number of angles is reduced to fit", default=1024)
+
+    parser.add_argument('--apply-fisheye', type=int, required=True, help='Whether to apply fisheye lens effect to the final images')
+    parser.add_argument('--apply-fisheye-all-layers', type=int, required=False, help='Whether to apply fisheye lens effect to all layers or just to the objects')
+    parser.add_argument('--fisheye-strength', type=float, required=False, default=0.5, help='Whether to apply fisheye lens effect to the final images')
+    parser.add_argument('--crop-fisheye', type=int, required=False, help='Whether to apply fisheye lens effect to all layers or just to the objects')
+
+    parser.add_argument('--upload-category', type=str, required=False, help="Which category to upload data to in Edge Impulse", default='split')
+    parser.add_argument('--synthetic-data-job-id', type=int, required=False, help="If specified, sets the synthetic_data_job_id metadata key")
+    parser.add_argument('--skip-upload', type=int, required=False, help="If set to 1, skip uploading to EI", default=0)
+    parser.add_argument('--upload-concurrency', type=int, required=False, help="Number of files to upload to EI at the same time", default=4)
+    parser.add_argument('--upload-batch-size', type=int, required=False, help="Number of files to send to EI in a single request", default=1)
+    parser.add_argument('--upload-retries', type=int, required=False, help="How many times to retry an upload that was rate limited or hit a server error", default=5)
+    parser.add_argument('--out-directory', type=str, required=False, help="Directory to save images to", default="output")
+    parser.add_argument('--resume', type=int, required=False, help="If set to 1, continues the job in the output directory (from its labels journal) instead of starting over, images that are done aren't made or uploaded again", default=0)
+    parser.add_argument('--output-format', type=str, required=False, help="Image format to save the composites as: 'png', 'jpg' or 'webp'", default='png')
+    parser.add_argument('--png-compression-level', type=int, required=False, help="zlib compression level for PNGs, from 0 (fastest, biggest files) to 9 (slowest, smallest files), the image engine's default if not set")
+    parser.add_argument('--output-quality', type=int, required=False, help="Quality for JPG and WebP images (1-100)", default=90)
+    parser.add_argument('--tile-size', type=str, required=False, help="If set, writes tiles of this size ('640' or '640x480') cut from every composite instead of the whole composite")
+    parser.add_argument('--tiles-per-composite', type=int, required=False, help="Number of tiles to cut from every composite at random positions, 0 covers the composite with a grid of tiles at every tile scale", default=4)
+    parser.add_argument('--tile-scales', type=str, required=False, help="Comma-separated scales to cut tiles at, e.g. '1,0.5,0.25' (0.5 cuts a region twice the tile size and halves it), every random tile picks one", default='1')
+    parser.add_argument('--tile-min-visibility', type=float, required=False, help="Minimum part (0-1) of an object's bounding box that has to be in a tile for it to be labelled in that tile", default=0.5)
+    parser.add_argument('--drop-empty-tiles', type=int, required=False, help="If set to 1, tiles without any objects aren't written", default=0)
+    parser.add_argument('--writer-threads', type=int, required=False, help="Number of threads that encode and write images in the background", default=2)
+    parser.add_argument('--stage-timings', type=str, required=False, help="If set, writes the time spent in each stage of the pipeline to this JSON file (used by benchmark.py)")
+    parser.add_argument('--log-level', type=str, required=False, help="How much to log: 'debug' (every placed object), 'info', 'warning' or 'error'", default='info')
+    parser.add_argument('--profile', type=str, required=False, help="If set, profiles the job and writes the profile to this file (worker processes aren't profiled, use --workers 1 to profile image generation)")
+    parser.add_argument('--profiler', type=str, required=False, help="Profiler to use with --profile: 'cprofile' (stats file for pstats or snakeviz) or 'pyinstrument' (HTML report, needs pyinstrument installed)", default='cprofile')
+    parser.add_argument('--seed', type=int, required=False, help="Random seed, each image gets its own seed derived from this so results do not depend on the number of workers (random if not set)")
+    parser.add_argument('--engine', type=str, required=False, help="Image engine to build the composites with: 'wand' (ImageMagick) or 'numpy' (NumPy/OpenCV)", default='wand')
+    parser.add_argument('--asset-cache-size', type=float, required=False, help="Memory budget in MB for decoded background and object images, least recently used images are dropped first (split between the workers)", default=2048)
+    parser.add_argument('--mmap-bmp', type=int, required=False, help="If set to 1, uncompressed BMPs are memory-mapped instead of decoded (numpy engine only)", default=0)
+    parser.add_argument('--workers', type=int, required=False, help="Number of worker processes to generate images with (0 for one per CPU core)", default=1)
+    parser.add_argument('--shared-assets', type=int, required=False, help="If set to 1, backgrounds and objects are decoded once and shared with all worker processes through shared memory, instead of decoded by every worker, when they fit in --asset-cache-size (numpy engine only)", default=1)
+    return parser
+
+def parse_config(argv=None, exit_on_error=True):
+    # Unknown arguments are ignored, so the block keeps working when new parameters are passed in
+    config, unknown = build_parser(exit_on_error).parse_known_args(argv)
+    return config
+
+# State that outlives a single job
+_engines = {}
+_image_caches = {}
+_blur_caches = {}
+# (model, threads) -> sessions not in use by a rembg worker
+_rembg_sessions = {}
+_rembg_sessions_lock = threading.Lock()
+_atlas = (None, None)
+# The job that is running, forked workers inherit it (see _generate_composite)
+_job = None
+
+def get_cached_engine(name):
+    if name not in _engines:
+        _engines[name] = get_engine(name)
+    return _engines[name]
+
+def get_image_cache(engine, max_size_mb, mmap_bmp):
+    key = (engine.name, bool(mmap_bmp))
+    if key not in _image_caches:
+        _image_caches[key] = ImageCache(engine, max_size_mb=max_size_mb, mmap_bmp=mmap_bmp)
+    images = _image_caches[key]
+    images.max_bytes = int(max_size_mb * 1024 * 1024)
+    return images
+
+def get_blur_cache(engine, max_size_mb):
+    if engine.name not in _blur_caches:
+        _blur_caches[engine.name] = VariantCache(engine, max_size_mb)
+    blurred = _blur_caches[engine.name]
+    blurred.max_bytes = int(max_size_mb * 1024 * 1024)
+    return blurred
+
+def new_rembg_session(model, threads):
+    # Same as rembg.new_session, but with the number of onnxruntime threads set on the session
+    # instead of through OMP_NUM_THREADS
+    import onnxruntime as ort
+    from rembg.sessions import sessions_class
+    session_class = next((sc for sc in sessions_class if sc.name() == model), None)
+    if session_class is None:
+        raise ValueError(f'Unknown rembg model: {model}')
+    sess_opts = ort.SessionOptions()
+    sess_opts.intra_op_num_threads = threads
+    sess_opts.inter_op_num_threads = 1
+    return session_class(model, sess_opts)
+
+@contextmanager
+def rembg_session(model, threads):
+    # Every rembg worker thread borrows its own session, with its share of the cores, and gives it
+    # back when done. Sessions are kept for the next job, so a model is loaded at most once per
+    # worker thread
+    key = (model, threads)
+    with _rembg_sessions_lock:
+        idle = _rembg_sessions.setdefault(key, [])
+        session = idle.pop() if len(idle) > 0 else None
+    if session is None:
+        log.info(f'Loading rembg model {model} ({threads} onnxruntime threads)')
+        session = new_rembg_session(model, threads)
+    try:
+        yield session
+    finally:
+        with _rembg_sessions_lock:
+            _rembg_sessions[key].append(session)
+
+def remove_background_and_crop(image, session):
+    from rembg import remove
+
+    # rembg expects RGB, cv2 decodes to BGR
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+    # Remove the background, this gives an RGBA image
+    image_no_bg = np.asarray(remove(image, session=session))
+
+    # Find the bounding box of the object from the rows and columns that have any visible pixels
+    visible = image_no_bg[:, :, 3] > 1
+    columns = np.flatnonzero(visible.any(axis=0))
+    rows = np.flatnonzero(visible.any(axis=1))
+    if len(columns) == 0:
+        return None, (0, 0, 0, 0)
+    x, y = int(columns[0]), int(rows[0])
+    w, h = int(columns[-1]) - x + 1, int(rows[-1]) - y + 1
+
+    # Crop the image to the bounding box
+    cropped_image = cv2.cvtColor(image_no_bg[y:y+h, x:x+w], cv2.COLOR_RGBA2BGRA)
+
+    return cropped_image, (x, y, w, h)
+
+def resize_image(image, width, height):
+    interpolation = cv2.INTER_AREA if width < image.shape[1] else cv2.INTER_CUBIC
+    return cv2.resize(image, (width, height), interpolation=interpolation)
+
+def resize_raw_object(img, filename, params):
+    img_height, img_width = img.shape[:2]
+    if params['mode'] == 'fit-height':
+        # Resize the raw object image to the height of the first background image in the background directory maintaining the aspect ratio
+        bg_width, bg_height = params['background']
+        # Calculate the new width while maintaining the aspect ratio
+        aspect_ratio = img_width / img_height
+        new_width = int(bg_height * aspect_ratio)
+        # Resize the image to match the bg_height while maintaining the aspect ratio
+        img = resize_image(img, new_width, bg_height)
+
+        log.info(f'Reszied raw object image using {params["mode"]} to {bg_width}x{bg_height}: {filename}')
+    elif params['mode'] == 'fit-width':
+        # Resize the raw object image to the width of the first background image in the background directory maintaining the aspect ratio
+        bg_width, bg_height = params['background']
+        # Calculate the new height while maintaining the aspect ratio
+        aspect_ratio = img_width / img_height
+        new_height = int(bg_width / aspect_ratio)
+        # Resize the image to match the bg_width while maintaining the aspect ratio
+        img = resize_image(img, bg_width, new_height)
+
+        log.info(f'Resized raw object image using {params["mode"]} to {bg_width}x{bg_height}: {filename}')
+    elif params['mode'] == 'custom-scaling-factor':
+        # Resize the raw object image by the specified scaling factor
+        img = resize_image(img, int(img_width * params['factor']), int(img_height * params['factor']))
+
+        log.info(f'Resized raw object image using {params["mode"]} by {params["factor"]}x: {filename}')
+    elif params['mode'] == 'custom-pixels':
+        # Resize the raw object image to the specified width for the label (or the 'else' width)
+        if params['width'] is not None:
+            width = params['width']
+            # Calculate the new height while maintaining the aspect ratio
+            aspect_ratio = img_width / img_height
+            new_height = int(width / aspect_ratio)
+            # Resize the image to match the width while maintaining the aspect ratio
+            img = resize_image(img, width, new_height)
+
+            log.info(f'Resized raw object image using {params["mode"]} to {width}x{new_height}: {filename}')
+        else:
+            log.warning(f'Filename {filename} not found in custom resize dictionary, skipping resize: {filename}')
+    return img
+
+def get_atlas(engine, images, assets, config):
+    # The atlas is kept for the next job, as long as the objects and atlas settings stay the same
+    global _atlas
+    if config.apply_motion_blur:
+        directions = [-90, 90] if config.motion_blur_direction == -1 else [config.motion_blur_direction]
+        blurs = [(sigma, direction) for direction in directions for sigma in BLUR_SIGMAS]
+    else:
+        blurs = [None]
+    key = (engine.name, tuple(asset.version for asset in assets), config.atlas_angles, bool(config.allow_rotate), tuple(blurs), config.atlas_max_mb)
+    if _atlas[0] != key:
+        _atlas = (None, None)
+        _atlas = (key, build_atlas(engine, images, assets, config.atlas_angles, blurs, config.atlas_max_mb, rotate=bool(config.allow_rotate)))
+    return _atlas[1]
+
+OUTPUT_FORMATS = ('png', 'jpg', 'webp')
+LOG_LEVELS = ('debug', 'info', 'warning', 'error')
+PROFILERS = ('cprofile', 'pyinstrument')
+# Counters and throughput of the last job, written next to the labels
+METRICS_FILENAME = 'metrics.json'
+
+# Settings that can change when a job is resumed, everything else has to be the same
+RESUME_IGNORED_SETTINGS = ('images', 'resume', 'seed', 'workers', 'writer_threads', 'stage_timings', 'log_level', 'profile', 'profiler', 'skip_upload',
+    'upload_category', 'upload_concurrency', 'upload_batch_size', 'upload_retries', 'synthetic_data_job_id',
+    'remove_background', 'ignore_already_resized', 'rembg_workers', 'rembg_cache_dir', 'rembg_cache_size',
+    'asset_cache_size', 'blur_cache_size', 'mmap_bmp', 'shared_assets')
+
+def clear_output(directory):
+    # Remove the images and labels of a previous job, leaving anything else in the directory alone
+    for filename in os.listdir(directory):
+        generated = filename.startswith('composite.') and filename.endswith(tuple('.' + f for f in OUTPUT_FORMATS))
+        if generated or filename in (JOURNAL_FILENAME, LABELS_FILENAME, METRICS_FILENAME):
+            os.remove(os.path.join(directory, filename))
+
+def _generate_composite(i):
+    # Runs in the pool workers, which are forked after _job is set. The workers already run in
+    # parallel, so they encode and write the images themselves (the upload reads them from disk)
+    outputs, stats, image_timer = _job.generate_composite(i)
+    files = []
+    for filename, image, boxes in outputs:
+        data, seconds = _job.write_composite(filename, image)
+        image_timer.add('encode', seconds)
+        files.append((filename, boxes, None))
+    return files, stats, image_timer.to_dict()
+
+def _attach_shared_assets(location):
+    # Pool initializer, the workers read the images from the shared asset store instead of decoding
+    # them again (and the images that aren't in it from the image cache they inherited)
+    _job.images = SharedAssets.attach(*location, fallback=_job.images)
+
+def _split_asset_budget(max_bytes):
+    # Pool initializer, the images the worker inherited stay shared and every worker decodes the
+    # rest within its share of the asset budget, so the memory doesn't grow with the number of workers
+    _job.images.share(max_bytes)
+
+class Job:
+    def __init__(self, config):
+        args = config
+        self.config = config
+
+        if args.labels == 'all':
+            self.labels = ['all']
+        else:
+            self.labels = args.labels.split(',')
+
+        self.custom_resize_dict = {}
+        if args.custom_raw_resize_pixels:
+            try:
+                custom_resize_list = args.custom_raw_resize_pixels.split('],[')
+                custom_resize_list[0] = custom_resize_list[0][1:]
+                custom_resize_list[-1] = custom_resize_list[-1][:-1]
+                for item in custom_resize_list:
+                    label, width = item.split(',')
+                    self.custom_resize_dict[label] = int(width)
+            except Exception as e:
+                raise GeneratorError(f"Error parsing custom raw resize argument: {e}")
+
+        # Check if the object area is in the correct format and parse as integers
+        if args.object_area == '-1':
+            self.object_area = -1
+        else:
+            object_area = args.object_area.split(',')
+            if len(object_area) != 4:
+                raise GeneratorError('Invalid value for "--object-area", should be "x1,y1,x2,y2" (was: "' + args.object_area + '")')
+            try:
+                self.object_area = [int(i) for i in object_area]
+            except ValueError:
+                raise GeneratorError('Invalid value for "--object-area", should be "x1,y1,x2,y2" (was: "' + args.object_area + '")')
+
+        if args.output_format not in OUTPUT_FORMATS:
+            raise GeneratorError('Invalid value for "--output-format", should be one of: ' + ', '.join(OUTPUT_FORMATS) + ' (was: "' + args.output_format + '")')
+        if args.png_compression_level is not None and not 0 <= args.png_compression_level <= 9:
+            raise GeneratorError('Invalid value for "--png-compression-level", should be between 0 and 9 (was: ' + str(args.png_compression_level) + ')')
+
+        self.tile_size = None
+        if args.tile_size:
+            try:
+                self.tile_size = parse_tile_size(args.tile_size)
+            except ValueError:
+                raise GeneratorError('Invalid value for "--tile-size", should be "size" or "widthxheight" (was: "' + args.tile_size + '")')
+            try:
+                self.tile_scales = parse_tile_scales(args.tile_scales)
+            except ValueError:
+                raise GeneratorError('Invalid value for "--tile-scales", should be comma-separated positive numbers (was: "' + args.tile_scales + '")')
+            if args.tiles_per_composite < 0:
+                raise GeneratorError('Invalid value for "--tiles-per-composite", should be 0 or more (was: ' + str(args.tiles_per_composite) + ')')
+            if not 0 <= args.tile_min_visibility <= 1:
+                raise GeneratorError('Invalid value for "--tile-min-visibility", should be between 0 and 1 (was: ' + str(args.tile_min_visibility) + ')')
+        if args.log_level.lower() not in LOG_LEVELS:
+            raise GeneratorError('Invalid value for "--log-level", should be one of: ' + ', '.join(LOG_LEVELS) + ' (was: "' + args.log_level + '")')
+        if args.profiler not in PROFILERS:
+            raise GeneratorError('Invalid value for "--profiler", should be one of: ' + ', '.join(PROFILERS) + ' (was: "' + args.profiler + '")')
+        if args.profile and args.profiler == 'pyinstrument':
+            try:
+                import pyinstrument
+            except ImportError:
+                raise GeneratorError('--profiler pyinstrument needs pyinstrument installed (pip install pyinstrument), or use --profiler cprofile')
+
+        if (args.upload_category != 'split' and args.upload_category != 'training' and args.upload_category != 'testing'):
+            raise GeneratorError('Invalid value for "--upload-category", should be "split", "training" or "testing" (was: "' + args.upload_category + '")')
+        if args.upload_concurrency < 1:
+            raise GeneratorError('Invalid value for "--upload-concurrency", should be 1 or more (was: ' + str(args.upload_concurrency) + ')')
+
+        self.api_key = os.environ.get("EI_PROJECT_API_KEY")
+        if not args.skip_upload and not self.api_key:
+            raise GeneratorError('Missing EI_PROJECT_API_KEY')
+
+        try:
+            self.engine = get_cached_engine(args.engine)
+        except Exception as e:
+            raise GeneratorError(str(e))
+
+        self.bg_dir = os.path.join(args.composite_dir, 'background')
+        self.obj_dir = os.path.join(args.composite_dir, 'object')
+        self.raw_obj_dir = args.raw_object_dir
+        self.rembg_cache = None
+        self.rembg_threads = 1
+
+        # Every image gets its own random generator seeded from (seed, image index), so the output
+        # only depends on the seed and not on how the images are spread across worker processes
+        if args.seed is None:
+            self.seed = random.randrange(2**32)
+        else:
+            self.seed = args.seed
+
+        self.workers = args.workers if args.workers > 0 else os.cpu_count()
+
+        # Time spent in each stage of the pipeline, written to --stage-timings
+        self.timer = StageTimer()
+
+    # Everything that decides how a raw object is resized, also used as part of the rembg cache key
+    def raw_resize_params(self, filename):
+        args = self.config
+        params = { 'mode': args.resize_raw_objects }
+        if args.resize_raw_objects in ('fit-height', 'fit-width'):
+            params['background'] = [self.bg_assets[0].width, self.bg_assets[0].height]
+        elif args.resize_raw_objects == 'custom-scaling-factor':
+            params['factor'] = args.custom_raw_resize_scaling_factor
+        elif args.resize_raw_objects == 'custom-pixels':
+            params['width'] = self.custom_resize_dict.get(filename, self.custom_resize_dict.get('else'))
+        return params
+
+    def process_raw_object(self, filename):
+        # Decode, resize and remove the background of a single raw object, returns a status message
+        args = self.config
+        start = time.time()
+        #change output filename to .png
+        out_filename = filename.split('.')[0] + '.png'
+        out_path = os.path.join(self.obj_dir, out_filename)
+
+        with open(os.path.join(self.raw_obj_dir, filename), 'rb') as f:
+            raw_bytes = f.read()
+        params = self.raw_resize_params(filename)
+
+        if self.rembg_cache is not None:
+            cache_params = { 'resize': params, 'model': args.rembg_model }
+            cache_key = self.rembg_cache.key(raw_bytes, cache_params)
+            cached = self.rembg_cache.get(cache_key)
+            if cached is not None:
+                png_bytes, (x, y, w, h) = cached
+                with open(out_path, 'wb') as f:
+                    f.write(png_bytes)
+                return f'Cropped object with dimensions {w}x{h} to {out_path} (cached, {time.time() - start:.2f}s)'
+
+        img = cv2.imdecode(np.frombuffer(raw_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            return f'Failed to decode raw object image: {filename}'
+        img = resize_raw_object(img, filename, params)
+        with rembg_session(args.rembg_model, self.rembg_threads) as session:
+            cropped_image, (x, y, w, h) = remove_background_and_crop(img, session)
+        if cropped_image is None:
+            return f'No object found in raw object image, skipping: {filename}'
+
+        # Save the result as a png with transparency
+        _, png = cv2.imencode('.png', cropped_image)
+        png_bytes = png.tobytes()
+        with open(out_path, 'wb') as f:
+            f.write(png_bytes)
+        if self.rembg_cache is not None:
+            self.rembg_cache.put(cache_key, png_bytes, (x, y, w, h), cache_params)
+        return f'Cropped object with dimensions {w}x{h} to {out_path} ({time.time() - start:.2f}s)'
+
+    def remove_backgrounds(self):
+        # Remove the background from the object images and save them in the object directory
+        args = self.config
+        if not self.raw_obj_dir:
+            raise GeneratorError('Missing raw object directory')
+        if not os.path.exists(self.raw_obj_dir):
+            raise GeneratorError('Raw object directory not found: ' + self.raw_obj_dir)
+        if args.rembg_cache_size > 0:
+            self.rembg_cache = RembgCache(args.rembg_cache_dir or os.path.join(args.composite_dir, '.rembg-cache'), args.rembg_cache_size)
+
+        raw_filenames = []
+        for filename in os.listdir(self.raw_obj_dir):
+            if filename.endswith(IMAGE_EXTENSIONS):
+                # Check if out_filename already exists in the object directory
+                out_filename = filename.split('.')[0] + '.png'
+                if os.path.exists(os.path.join(self.obj_dir, out_filename)) and args.ignore_already_resized:
+                    log.info(f'Object image already exists: {out_filename}')
+                    continue
+                raw_filenames.append(filename)
+
+        # Raw objects are processed on a thread pool (cv2 and onnxruntime release the GIL), each
+        # worker has its own session and the cores are split between them so together they use
+        # every core once
+        rembg_workers = max(1, min(args.rembg_workers, len(raw_filenames)))
+        self.rembg_threads = max(1, (os.cpu_count() or 1) // rembg_workers)
+        rembg_start = time.time()
+        with self.timer.stage('rembg'), ThreadPoolExecutor(max_workers=rembg_workers) as executor:
+            for n, message in enumerate(executor.map(self.process_raw_object, raw_filenames)):
+                log.info(f'[{n+1}/{len(raw_filenames)}] {message}')
+        log.info(f'Processed {len(raw_filenames)} raw objects in {time.time() - rembg_start:.2f}s')
+
+    def get_fisheye_lens(self, width, height):
+        from fisheye import get_lens
+        args = self.config
+        # The background is only cropped when it goes through the lens as well
+        crop = bool(args.crop_fisheye) and bool(args.apply_fisheye_all_layers)
+        return get_lens(width, height, strength=args.fisheye_strength, crop=crop)
+
+    def image_rng(self, index):
+        # Derive a well-mixed, independent seed for each image index
+        image_seed = int(np.random.SeedSequence([self.seed, index]).generate_state(1)[0])
+        return random.Random(image_seed)
+
+    def generate_composite(self, i):
+        args = self.config
+        engine = self.engine
+        images = self.images
+        bg_assets = self.bg_assets
+        obj_assets = self.obj_assets
+        atlas = self.atlas
+        rng = self.image_rng(i)
+        # Stage timings for this image, merged into the job timer by the main process
+        image_timer = StageTimer()
+        # (label id, x, y, width, height) of every placed object, see boxes.py
+        placed_boxes = []
+        # The background itself is never changed (blurring, the fisheye lens and flattening all make
+        # new images), so it doesn't need to be cloned
+        with image_timer.stage('asset_loading'):
+            background_asset = bg_assets[rng.randrange(len(bg_assets))]
+            background = engine.view(images.get(background_asset))
+        # Define the dimensions of the background image
+        background_width, background_height = engine.size(background)
+        # init the object layer with transparent background and same size as the background
+        object_layer = engine.new_layer(background_width, background_height)
+        if self.object_area == -1:
+            image_object_area = [0, 0, background_width, background_height]
+        else:
+            image_object_area = self.object_area
+        # Define the dimensions of the area where objects can be placed
+        object_area_left = image_object_area[0]
+        object_area_top = image_object_area[1]
+        object_area_width = image_object_area[2] - image_object_area[0]
+        object_area_height = image_object_area[3] - image_object_area[1]
+
+        if args.apply_motion_blur:
+            blur_amount = rng.randrange(8)
+            if args.motion_blur_direction == -1:
+                blur_direction = rng.choice([-90, 90])
+            else:
+                blur_direction = args.motion_blur_direction
+            # Every background is blurred once for each (sigma, direction)
+            source = background
+            with image_timer.stage('rotate_blur'):
+                background = self.blurred_backgrounds.get((background_asset.version, blur_amount, blur_direction),
+                    lambda: engine.motion_blur(engine.clone(source), blur_amount, blur_direction))
+            blur = (blur_amount, blur_direction)
+        else:
+            blur = None
+
+        # With overlap disabled, objects are only placed on free parts of the object area (see placement.py)
+        grid = None
+        if not args.allow_overlap:
+            grid = OccupancyGrid(object_area_left, object_area_top, object_area_width, object_area_height)
+
+        def place_object(object, rotate, first_fit=False):
+            # Prepare the object and find a position for it, returns None if it can't be placed
+            if atlas is not None:
+                # Pre-rendered variant, already rotated and blurred (angle bucket 0 is unrotated)
+                with image_timer.stage('rotate_blur'):
+                    object_image = atlas.get(object, rng.randrange(len(atlas.angles)) if rotate else 0, blur)
+                blurred = True
+            else:
+                with image_timer.stage('asset_loading'):
+                    object_image = engine.clone(images.get(object))
+                if rotate:
+                    with image_timer.stage('rotate_blur'):
+                        object_image = engine.rotate(object_image, rng.uniform(0, 360))
+                blurred = not args.apply_motion_blur
+
+            object_width, object_height = engine.size(object_image)
+
+            # Place the object in a random position within the defined area
+
+            # Ensure the object can fit within the defined area
+            if object_area_width >= object_width and object_area_height >= object_height:
+                with image_timer.stage('placement'):
+                    if grid is not None:
+                        position = grid.sample(object_width, object_height, rng, first_fit=first_fit)
+                        if position is None:
+                            return None
+                        x, y = position
+                    else:
+                        x = rng.randint(object_area_left, object_area_left + object_area_width - object_width)
+                        y = rng.randint(object_area_top, object_area_top + object_area_height - object_height)
+                if not blurred:
+                    with image_timer.stage('rotate_blur'):
+                        object_image = engine.motion_blur(object_image, blur_amount, blur_direction)
+            else:
+                if args.crop_object_outside_area:
+                    if not blurred:
+                        with image_timer.stage('rotate_blur'):
+                            object_image = engine.motion_blur(object_image, blur_amount, blur_direction)
+                    elif atlas is not None:
+                        # Atlas variants are shared, don't crop the original
+                        object_image = engine.clone(object_image)
+                    # Handle the case where the object cannot fit within the defined area and crop it to fit within the area
+                    # Randomly place the object within the defined area (+- half the width of the object)
+                    x = rng.randint(object_area_left - int(object_width/2), object_area_left + object_area_width- int(object_width/2))
+                    y = rng.randint(object_area_top - int(object_height/2), object_area_top + object_area_height- int(object_height/2))
+                    log.debug(f"Initial position: x={x}, y={y}, object_width={object_width}, object_height={object_height}")
+
+                    # Crop the object to the part of it that's inside the defined area
+                    left, top = max(x, object_area_left), max(y, object_area_top)
+                    right = min(x + object_width, object_area_left + object_area_width)
+                    bottom = min(y + object_height, object_area_top + object_area_height)
+                    if (left, top, right, bottom) != (x, y, x + object_width, y + object_height):
+                        object_image = engine.crop(object_image, left - x, top - y, right - left, bottom - top)
+                        stats.cropped += 1
+                    x, y, object_width, object_height = left, top, right - left, bottom - top
+
+                    log.debug(f"Final position: x={x}, y={y}, object_width={object_width}, object_height={object_height}")
+
+                    # Check if the object overlaps with any previously placed objects
+                    if grid is not None and not grid.is_free(x, y, object_width, object_height):
+                        return None
+                else:
+                    # Handle the case where the object cannot fit within the defined area
+                    log.debug("Error: Object cannot fit within the defined area. Use the Crop Objects Outside Area option to crop the object to fit within the area.")
+                    stats.too_large += 1
+                    return None
+
+            return object_image, x, y, object_width, object_height
+
+        # Create a new image for each object
+        stats = PlacementStats()
+        stats.target = rng.randrange(args.min_objects, args.objects + 1)
+        for n in range(stats.target):
+            placed = None
+            for attempt in range(1 if args.allow_overlap else args.placement_attempts):
+                stats.attempts += 1
+                # Load the object image
+                object = obj_assets[rng.randrange(len(obj_assets))]
+                placed = place_object(object, args.allow_rotate)
+                if placed is not None:
+                    break
+                stats.rejected += 1
+
+            if placed is None and grid is not None and n < args.min_objects:
+                # Before giving up on the minimum number of objects, try every object without rotation
+                # (smallest first) in the top-left most free position
+                for object in sorted(obj_assets, key=lambda asset: asset.width * asset.height):
+                    stats.attempts += 1
+                    placed = place_object(object, False, first_fit=True)
+                    if placed is not None:
+                        break
+                    stats.rejected += 1
+
+            if placed is None:
+                if grid is not None:
+                    # There's no room left for any more objects
+                    break
+                continue
+
+            object_image, x, y, object_width, object_height = placed
+            with image_timer.stage('compositing'):
+                object_layer = engine.composite(object_layer, object_image, x, y)
+            if grid is not None:
+                grid.add(x, y, object_width, object_height)
+
+            # Add the object's position and size to the list of placed objects
+            placed_boxes.append((self.label_ids[object.label], x, y, object_width, object_height))
+        stats.placed = len(placed_boxes)
+        boxes = make_boxes(placed_boxes)
+
+        if args.apply_fisheye:
+            from fisheye import adjust_boxes
+            with image_timer.stage('fisheye'):
+                object_layer_np = engine.to_array(object_layer)
+                background_np = engine.to_array(background)
+
+                # Both layers go through the same (cached) lens, so they share the crop box
+                lens = self.get_fisheye_lens(background_width, background_height)
+                if args.apply_fisheye_all_layers:
+                    background_np = lens.apply(background_np)
+                object_layer_np = lens.apply(object_layer_np)
+                background_crop_box = lens.crop_box
+                # convert back to Image for each layer
+                object_layer = engine.from_array(object_layer_np)
+                background = engine.from_array(background_np)
+
+                boxes = adjust_boxes(boxes, background_np.shape[1], background_np.shape[0], background_crop_box, strength=args.fisheye_strength)
+
+        # Labels never reach outside the image (the lens can push the edge of a box out of it)
+        boxes = clip_boxes(boxes, 0, 0, background_width, background_height)
+
+        # composite the object layer on top of the background
+        with image_timer.stage('compositing'):
+            composite = engine.flatten(background, object_layer)
+
+        if self.tile_size is None:
+            return [(f'composite.{self.epoch}.{i}.{args.output_format}', composite, boxes)], stats, image_timer
+
+        # Cut the composite into tiles, each with the boxes that are visible in it (tiles are numbered
+        # before empty ones are dropped, so the file names don't depend on that)
+        outputs = []
+        with image_timer.stage('tiling'):
+            width, height = engine.size(composite)
+            regions = tile_regions(width, height, self.tile_size[0], self.tile_size[1], self.tile_scales, args.tiles_per_composite, rng)
+            for k, (x, y, region_width, region_height, tile_width, tile_height) in enumerate(regions):
+                tile_boxes = crop_boxes(boxes, x, y, region_width, region_height, tile_width, tile_height, args.tile_min_visibility)
+                if len(tile_boxes) == 0 and args.drop_empty_tiles:
+                    stats.empty_tiles += 1
+                    continue
+                tile = engine.tile(composite, x, y, region_width, region_height, tile_width, tile_height)
+                outputs.append((f'composite.{self.epoch}.{i}.t{k}.{args.output_format}', tile, tile_boxes))
+        return outputs, stats, image_timer
+
+    def write_composite(self, filename, composite):
+        # Encodes the image once, the same bytes are written to disk and uploaded. Returns the
+        # encoded image and the time it took
+        args = self.config
+        start = time.perf_counter()
+        data = self.engine.encode(composite, args.output_format, compression_level=args.png_compression_level, quality=args.output_quality)
+        with open(os.path.join(args.out_directory, filename), 'wb') as f:
+            f.write(data)
+        return data, time.perf_counter() - start
+
+    def run(self, on_image=None, preload_assets=False):
+        global _job
+        args = self.config
+        timer = self.timer
+        job_start = time.perf_counter()
+        for name in LOGGERS:
+            logging.getLogger(name).setLevel(args.log_level.upper())
+
+        if not os.path.exists(args.out_directory):
+            os.makedirs(args.out_directory)
+
+        # Check if the background and object directories exist
+        if not os.path.exists(self.bg_dir):
+            log.error(f'Background directory not found: {self.bg_dir}')
+            #print directories under the composite directory
+            if os.path.exists(args.composite_dir):
+                log.error(f'Directories under the composite directory: {os.listdir(args.composite_dir)}')
+            raise GeneratorError('Background directory not found: ' + self.bg_dir)
+        if not os.path.exists(self.obj_dir):
+            raise GeneratorError('Object directory not found: ' + self.obj_dir)
+
+        # Index the background folder, images are only decoded when they are used (see assets.py)
+        self.images = get_image_cache(self.engine, args.asset_cache_size, args.mmap_bmp)
+        # Every worker process blurs and caches backgrounds on its own, so they split the budget
+        self.blurred_backgrounds = get_blur_cache(self.engine, args.blur_cache_size / self.workers)
+        with timer.stage('asset_loading'):
+            self.bg_assets = scan_assets(self.bg_dir)
+            for asset in self.bg_assets:
+                if asset.width is None:
+                    self.images.get(asset)
+        for asset in self.bg_assets:
+            log.info(f'Found background image: {asset.filename} ({asset.width}x{asset.height})')
+        if len(self.bg_assets) == 0:
+            raise GeneratorError('No background images found in: ' + self.bg_dir)
+
+        if args.remove_background:
+            self.remove_backgrounds()
+
+        # Index the objects folder, keeping the images with a label in the labels list (or all of them if labels is 'all')
+        with timer.stage('asset_loading'):
+            self.obj_assets = scan_assets(self.obj_dir, labels=self.labels, label_from_filename=True)
+            for asset in self.obj_assets:
+                if asset.width is None:
+                    self.images.get(asset)
+        for asset in self.obj_assets:
+            log.info(f'Found object image: {asset.filename} ({asset.width}x{asset.height})')
+        if len(self.obj_assets) == 0:
+            raise GeneratorError('No object images found in: ' + self.obj_dir)
+        # Boxes store a label id, the label names are only looked up when the labels are written
+        self.label_names = sorted(set(asset.label for asset in self.obj_assets))
+        self.label_ids = { label: index for index, label in enumerate(self.label_names) }
+
+        self.atlas = None
+        if args.atlas_angles > 0:
+            with timer.stage('atlas'):
+                self.atlas = get_atlas(self.engine, self.images, self.obj_assets, args)
+
+        # The images are picked by index from the asset lists, so those are part of the job settings
+        settings = { name: value for name, value in sorted(vars(args).items()) if name not in RESUME_IGNORED_SETTINGS }
+        settings['background_files'] = [asset.filename for asset in self.bg_assets]
+        settings['object_files'] = [asset.filename for asset in self.obj_assets]
+        settings_hash = hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()
+
+        journal = LabelJournal(args.out_directory)
+        previous = read_journal(journal.path) if args.resume else None
+        done = {}
+        not_uploaded = []
+        if previous is not None and previous.header is not None:
+            header = previous.header
+            if header['settings'] != settings_hash:
+                raise GeneratorError('Can\'t resume the job in ' + args.out_directory + ', it was started with different settings or source images')
+            if args.seed is not None and args.seed != header['seed']:
+                raise GeneratorError('Can\'t resume the job in ' + args.out_directory + ', it was started with seed ' + str(header['seed']))
+            # Continue with the same file names and random numbers, skipping the images that were written
+            self.epoch = header['epoch']
+            self.seed = header['seed']
+            for index, files in previous.images.items():
+                if index < args.images and all(os.path.exists(os.path.join(args.out_directory, filename)) for filename, _ in files):
+                    done[index] = files
+            not_uploaded = [(filename, objects) for _, files in sorted(done.items()) for filename, objects in files if filename not in previous.uploaded]
+            journal.open()
+            log.info(f'Resuming job {self.epoch}: {len(done)} of {args.images} images already done' +
+                  ('' if args.skip_upload else f', {len(not_uploaded)} of them still need uploading'))
+        else:
+            if args.resume:
+                log.info(f'No job to resume in {args.out_directory}, starting a new one')
+            clear_output(args.out_directory)
+            self.epoch = int(time.time())
+            journal.open({ 'epoch': self.epoch, 'seed': self.seed, 'settings': settings_hash })
+        todo = [i for i in range(args.images) if i not in done]
+
+        log.info(f'Number of images: {args.images}')
+        log.info(f'Objects to be generated: {args.objects}')
+        log.info(f'Allow overlap: {args.allow_overlap}')
+        log.info(f'Object area: {self.object_area}')
+        log.info(f'Seed: {self.seed}')
+        log.info(f'Workers: {self.workers}')
+        log.info('')
+
+        if preload_assets and self.workers > 1:
+            # Images decoded in the workers are gone after the job, so decode them here first to
+            # keep them for the next job (and share them with all workers)
+            with timer.stage('asset_loading'):
+                self.images.preload(self.bg_assets + self.obj_assets)
+
+        if args.apply_fisheye:
+            # Build the lenses for every background size up front, so forked workers inherit them
+            for width, height in set((asset.width, asset.height) for asset in self.bg_assets):
+                self.get_fisheye_lens(width, height)
+
+        _job = self
+        pool = None
+        writer = None
+        shared = None
+        if self.workers > 1:
+            # The images decoded so far are shared with the forked workers, what's left of the asset
+            # budget goes to the shared asset store if it fits, otherwise it's split between the
+            # workers to decode their own images in
+            available = max(0, self.images.max_bytes - self.images.used_bytes)
+            initializer, initargs = _split_asset_budget, (available // self.workers,)
+            if args.shared_assets and self.engine.name == 'numpy':
+                assets = self.bg_assets + self.obj_assets
+                index, size = SharedAssets.plan(self.engine, self.images, assets)
+                if len(index) == 0:
+                    log.info('Shared asset store not needed, every image is decoded or memory-mapped already')
+                elif size > available:
+                    log.info(f'Shared asset store not used, {len(index)} images need {size / 1024 / 1024:.1f} MB and '
+                             f'{available / 1024 / 1024:.1f} MB of the asset cache budget is left, workers decode their own images '
+                             f'in {available / self.workers / 1024 / 1024:.1f} MB each')
+                else:
+                    with timer.stage('asset_loading'):
+                        shared = SharedAssets.create(self.engine, self.images, assets, index, size)
+                    log.info(f'Shared asset store: {len(shared)} images, {shared.size / 1024 / 1024:.1f} MB ' +
+                             ('in shared memory' if shared.kind == 'shm' else 'in a memory-mapped file'))
+                    initializer, initargs = _attach_shared_assets, (shared.location(),)
+            # Workers are forked so they inherit the asset index and whatever images are already decoded
+            # (this happens before the upload and writer threads are started, so no threads are forked along)
+            pool = multiprocessing.get_context('fork').Pool(self.workers, initializer=initializer, initargs=initargs)
+            results = pool.imap(_generate_composite, todo)
+        else:
+            # Images are encoded and written on background threads while the next image is made
+            writer = ThreadPoolExecutor(max_workers=max(1, args.writer_threads))
+
+            def generate_serial():
+                for i in todo:
+                    outputs, stats, image_timer = self.generate_composite(i)
+                    files = [(filename, boxes, writer.submit(self.write_composite, filename, image)) for filename, image, boxes in outputs]
+                    yield files, stats, image_timer.to_dict()
+            results = generate_serial()
+
+        uploader = None
+        if not args.skip_upload:
+            from ingestion import get_ingestion_url, Uploader
+            uploader = Uploader(get_ingestion_url(os.environ.get("EI_INGESTION_HOST", "edgeimpulse.com")), self.api_key, args.upload_category,
+                metadata={
+                    'generated_by': 'composite-image-generator',
+                    'allow_overlap': str(args.allow_overlap),
+                    'allow_rotate': str(args.allow_rotate),
+                    'apply_motion_blur': str(args.apply_motion_blur),
+                    'motion_blur_direction': str(args.motion_blur_direction),
+                    'object_area': str(args.object_area),
+                },
+                synthetic_data_job_id=args.synthetic_data_job_id,
+                concurrency=args.upload_concurrency,
+                batch_size=args.upload_batch_size,
+                max_retries=args.upload_retries,
+                on_uploaded=journal.uploaded)
+            # Images from before the job was resumed that didn't make it to Edge Impulse
+            for filename, objects in not_uploaded:
+                uploader.submit(filename, os.path.join(args.out_directory, filename), objects)
+
+        # Placement stats of all images made by this job, and the number of files written
+        totals = PlacementStats()
+        files_written = 0
+
+        def written(files):
+            return all(write is None or write.done() for _, _, write in files)
+
+        def finish(i, files, stats):
+            # Called in image order once all files of the image are written
+            nonlocal files_written
+            totals.add(stats)
+            outputs = []
+            for filename, boxes, write in files:
+                data = None
+                if write is not None:
+                    data, seconds = write.result()
+                    timer.add('encode', seconds)
+                outputs.append((filename, boxes_to_objects(boxes, self.label_names), data))
+            # Tiles only show part of the composite, so they're reported with the objects in the composite
+            count = stats.placed if self.tile_size is not None else len(outputs[0][1])
+            message = f'Created image {i+1} of {args.images} with {count} objects ({stats})'
+            if count < args.min_objects:
+                message += f' (only {count} of the minimum {args.min_objects} objects fit)'
+            if self.tile_size is not None:
+                message += f', {len(outputs)} tiles'
+            journal.image(i, [(filename, objects) for filename, objects, _ in outputs])
+            for filename, objects, data in outputs:
+                if uploader is not None:
+                    # Uploads run in the background, reusing the encoded image (or the file the worker wrote)
+                    uploader.submit(filename, os.path.join(args.out_directory, filename), objects, data)
+                if on_image is not None:
+                    on_image(filename, objects)
+            files_written += len(outputs)
+            log.info(message + ' OK')
+
+        # Images that are still being written, at most a few per writer thread are kept in memory
+        pending = deque()
+        max_pending = 2 * max(1, args.writer_threads)
+        generation_start = time.perf_counter()
+        try:
+            # Results come back in image order, so the labels file matches a serial run
+            for i, (files, stats, image_timings) in zip(todo, results):
+                timer.merge(image_timings)
+                pending.append((i, files, stats))
+                while len(pending) > 0 and (written(pending[0][1]) or len(pending) > max_pending):
+                    finish(*pending.popleft())
+            while len(pending) > 0:
+                finish(*pending.popleft())
+
+        except Exception as e:
+            log.error('')
+            log.error(traceback.format_exc())
+            if pool is not None:
+                pool.terminate()
+            if uploader is not None:
+                uploader.close()
+            journal.close()
+            raise GeneratorError('Failed to complete composite image generation: ' + str(e) +
+                                 ' (run again with --resume 1 to continue where it stopped)') from e
+        finally:
+            _job = None
+            if shared is not None:
+                # Workers keep their mapping until they exit
+                shared.release()
+            if writer is not None:
+                writer.shutdown(wait=True, cancel_futures=True)
+
+        if pool is not None:
+            pool.close()
+            pool.join()
+        generation_seconds = time.perf_counter() - generation_start
+
+        with timer.stage('labels'):
+            labels = journal.compact()
+
+        if args.stage_timings:
+            with open(args.stage_timings, 'w') as file:
+                json.dump({
+                    'images': args.images,
+                    'workers': self.workers,
+                    'engine': self.engine.name,
+                    'total_seconds': time.perf_counter() - job_start,
+                    'stages': timer.to_dict(),
+                }, file, indent=4)
+
+        if self.rembg_cache is not None:
+            log.info(self.rembg_cache.summary())
+
+        result = {
+            'epoch': self.epoch,
+            'seed': self.seed,
+            'images': len(labels['boundingBoxes']),
+            'labels': labels,
+            'uploaded': 0,
+            'failed_uploads': [],
+            'stages': timer.to_dict(),
+        }
+        if uploader is not None:
+            log.info('Waiting for uploads to finish...')
+            result['failed_uploads'] = uploader.close()
+            result['uploaded'] = uploader.uploaded
+            log.info(f'Uploaded {uploader.uploaded} of {files_written + len(not_uploaded)} images ({uploader.retries} retries)')
+            if len(result['failed_uploads']) > 0:
+                log.warning(f"Failed to upload {len(result['failed_uploads'])} images:")
+                for filename, error in result['failed_uploads']:
+                    log.warning(f'  {filename}: {error}')
+        journal.close()
+
+        objects = totals.to_dict()
+        empty_tiles = objects.pop('empty_tiles')
+        images_per_second = len(todo) / generation_seconds if generation_seconds > 0 else 0.0
+        log.info(f'Generated {len(todo)} images in {generation_seconds:.2f}s ({images_per_second:.2f} images/s), '
+                 f'{objects["placed"]} objects placed, {objects["dropped"]} dropped, {objects["cropped"]} cropped, '
+                 f'{objects["rejected"]} placement attempts rejected' +
+                 (f', {files_written} tiles written ({empty_tiles} empty tiles dropped)' if self.tile_size is not None else ''))
+        if objects['too_large'] > 0:
+            log.warning(f'{objects["too_large"]} objects could not fit within the defined area. Use the Crop Objects Outside Area option to crop the objects to fit within the area.')
+        result['metrics'] = {
+            'epoch': self.epoch,
+            'seed': self.seed,
+            'engine': self.engine.name,
+            'workers': self.workers,
+            'images': len(todo),
+            'resumed_images': len(done),
+            'files': files_written,
+            'empty_tiles_dropped': empty_tiles,
+            'total_seconds': time.perf_counter() - job_start,
+            'generation_seconds': generation_seconds,
+            'images_per_second': images_per_second,
+            'objects': objects,
+            'uploads': {
+                'uploaded': result['uploaded'],
+                'failed': len(result['failed_uploads']),
+                'retries': uploader.retries if uploader is not None else 0,
+            },
+            'stages': timer.to_dict(),
+        }
+        with open(os.path.join(args.out_directory, METRICS_FILENAME), 'w') as file:
+            json.dump(result['metrics'], file, indent=4)
+        return result
+
+def generate(config, on_image=None, preload_assets=False):
+    # Runs a single job, config is the namespace from parse_config(). on_image(filename, objects) is
+    # called for every image as soon as it's written. With preload_assets the images are decoded
+    # in this process even when the job runs on worker processes, so they stay cached for the next
+    # job. Returns a summary of the job, and raises GeneratorError if the job can't run or fails
+    job = Job(config)
+    if not config.profile:
+        return job.run(on_image, preload_assets)
+    with profile(config.profile, config.profiler):
+        result = job.run(on_image, preload_assets)
+    log.info(f'Profile written to {config.profile}')
+    return result
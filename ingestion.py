@@ -0,0 +1,220 @@
+import os
+import json
+import logging
+import queue
+import random
+import threading
+import time
+import requests
+
+# Uploads composites to the Edge Impulse ingestion service on a separate stage, so generating
+# images never waits on the network. Files are handed over through a bounded queue (which only
+# blocks the generator when the uploads fall far behind) and uploaded by a number of worker
+# threads, each with its own keep-alive session. Rate limits and server errors are retried with
+# exponential backoff, and failed files are collected instead of stopping the whole job.
+#
+# With a batch size above 1, several files are sent in one multipart request, together with a
+# bounding_boxes.labels manifest with the labels for each file. Every entry in the returned files
+# list is checked, and files that failed in a batch are retried on their own.
+
+log = logging.getLogger(__name__)
+
+# Status codes that are worth retrying, anything else is treated as a permanent failure
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+CONTENT_TYPES = {
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.webp': 'image/webp',
+}
+
+def content_type(filename):
+    return CONTENT_TYPES.get(os.path.splitext(filename)[1].lower(), 'application/octet-stream')
+
+def get_ingestion_url(host):
+    if host.endswith('.test.edgeimpulse.com'):
+        return "http://ingestion." + host
+    if host == 'host.docker.internal':
+        return "http://" + host + ":4810"
+    # A local stand-in for the ingestion service, e.g. "localhost" or "127.0.0.1:8080"
+    if host.split(':')[0] in ('localhost', '127.0.0.1'):
+        if ':' not in host:
+            host = host + ":4810"
+        return "http://" + host
+    return "https://ingestion." + host
+
+class RetryableUploadError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class Uploader:
+    def __init__(self, ingestion_url, api_key, category, metadata, synthetic_data_job_id=None,
+                 concurrency=4, batch_size=1, max_retries=5, backoff=1.0, timeout=120, on_uploaded=None):
+        self.url = ingestion_url + '/api/' + category + '/files'
+        self.api_key = api_key
+        self.metadata = metadata
+        self.synthetic_data_job_id = synthetic_data_job_id
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        # Called with the filename (from an upload thread) for every file that was uploaded
+        self.on_uploaded = on_uploaded
+        self.uploaded = 0
+        self.retries = 0
+        self.failed = []
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=concurrency * max(batch_size, 4))
+        self._threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(concurrency)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, filename, path, objects, data=None):
+        # If no data is passed the file is read from disk by the upload thread
+        self._queue.put((filename, path, objects, data))
+
+    def close(self):
+        # Wait for all queued uploads to finish, returns the list of (filename, error) that failed
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        return self.failed
+
+    def _worker(self):
+        session = requests.Session()
+        done = False
+        while not done:
+            batch = []
+            item = self._queue.get()
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    # Wait a little for more files to fill up the batch
+                    item = self._queue.get(timeout=0.5)
+                except queue.Empty:
+                    break
+            if item is None:
+                done = True
+            if len(batch) == 0:
+                continue
+
+            files = []
+            for filename, path, objects, data in batch:
+                try:
+                    if data is None:
+                        with open(path, 'rb') as f:
+                            data = f.read()
+                    files.append((filename, data, objects))
+                except Exception as e:
+                    self._failed(filename, e)
+
+            if len(files) > 1:
+                try:
+                    results = self._with_retries(lambda: self._upload_batch(session, files), f'batch of {len(files)} files')
+                except Exception as e:
+                    log.warning(f'Failed to upload batch of {len(files)} files to Edge Impulse, uploading them one by one: {e}')
+                    results = { filename: e for filename, _, _ in files }
+                for filename, error in results.items():
+                    if error is None:
+                        self._uploaded(filename)
+                # Retry the files that failed in the batch on their own
+                files = [f for f in files if results.get(f[0]) is not None]
+
+            for filename, data, objects in files:
+                try:
+                    self._with_retries(lambda: self._upload(session, filename, data, objects), filename)
+                    self._uploaded(filename)
+                except Exception as e:
+                    self._failed(filename, e)
+        session.close()
+
+    def _uploaded(self, filename):
+        with self._lock:
+            self.uploaded += 1
+        if self.on_uploaded is not None:
+            self.on_uploaded(filename)
+
+    def _failed(self, filename, error):
+        log.warning(f'Failed to upload {filename} to Edge Impulse: {error}')
+        with self._lock:
+            self.failed.append((filename, str(error)))
+
+    def _with_retries(self, upload, description):
+        attempt = 0
+        while True:
+            try:
+                return upload()
+            except (RetryableUploadError, requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise
+                retry_after = getattr(e, 'retry_after', None)
+                delay = retry_after if retry_after is not None else self.backoff * (2 ** attempt) * (1 + random.random())
+                log.info(f'Retrying upload of {description} in {delay:.1f}s ({e})')
+                with self._lock:
+                    self.retries += 1
+                time.sleep(delay)
+                attempt += 1
+
+    def _headers(self):
+        headers = {
+            'x-api-key': self.api_key,
+            'x-metadata': json.dumps(self.metadata),
+        }
+        if self.synthetic_data_job_id is not None:
+            headers['x-synthetic-data-job-id'] = str(self.synthetic_data_job_id)
+        return headers
+
+    def _upload(self, session, filename, data, objects):
+        headers = self._headers()
+        headers['x-bounding-boxes'] = json.dumps(objects)
+        res = session.post(url=self.url, headers=headers, timeout=self.timeout,
+                           files = { 'data': (filename, data, content_type(filename)) })
+        body = check_response(res)
+        if (len(body['files']) == 0 or body['files'][0]['success'] != True):
+            raise Exception('Failed to upload file to Edge Impulse: ' + file_error(body['files'][0] if len(body['files']) > 0 else None))
+
+    def _upload_batch(self, session, files):
+        # Returns a dict of filename -> None if the file was uploaded, or the error if it wasn't
+        labels = {
+            "version": 1,
+            "type": "bounding-box-labels",
+            "boundingBoxes": { filename: objects for filename, _, objects in files }
+        }
+        multipart = [('data', (filename, data, content_type(filename))) for filename, data, _ in files]
+        multipart.append(('data', ('bounding_boxes.labels', json.dumps(labels), 'application/json')))
+        res = session.post(url=self.url, headers=self._headers(), timeout=self.timeout, files=multipart)
+        body = check_response(res)
+
+        results = { filename: Exception('File missing from the ingestion response') for filename, _, _ in files }
+        entries = [entry for entry in body['files'] if entry.get('fileName') != 'bounding_boxes.labels']
+        for ix, entry in enumerate(entries):
+            # Match entries on file name if the service returns it, otherwise on position
+            filename = entry.get('fileName')
+            if filename not in results:
+                if ix >= len(files):
+                    continue
+                filename = files[ix][0]
+            results[filename] = None if entry.get('success') == True else Exception('Failed to upload file to Edge Impulse: ' + file_error(entry))
+        return results
+
+def check_response(res):
+    if (res.status_code in RETRY_STATUS_CODES):
+        retry_after = res.headers.get('retry-after')
+        raise RetryableUploadError('Failed to upload file to Edge Impulse (status_code=' + str(res.status_code) + '): ' + res.content.decode("utf-8"),
+                                   retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None)
+    if (res.status_code != 200):
+        raise Exception('Failed to upload file to Edge Impulse (status_code=' + str(res.status_code) + '): ' + res.content.decode("utf-8"))
+    body = json.loads(res.content.decode("utf-8"))
+    if (body['success'] != True):
+        raise Exception('Failed to upload file to Edge Impulse: ' + body['error'])
+    return body
+
+def file_error(entry):
+    if entry is None:
+        return 'no files in the ingestion response'
+    return str(entry.get('error', 'unknown error'))
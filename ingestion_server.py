@@ -0,0 +1,151 @@
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the Edge Impulse ingestion service, to test uploads without a project. It
+# accepts the same multipart POSTs to /api/<category>/files as the real service and answers in the
+# same format, and can be told to fail requests or single files:
+#
+#     python3 ingestion_server.py --port 4810 --fail-every 3
+#     EI_INGESTION_HOST=localhost python3 transform.py ...
+#
+# check_ingestion.py uses it to test the retries and batch handling in ingestion.py.
+
+def parse_multipart(content_type, body):
+    # Returns a list of (filename, data) for every file in a multipart/form-data body
+    boundary = None
+    for param in content_type.split(';'):
+        name, _, value = param.strip().partition('=')
+        if name == 'boundary':
+            boundary = value.strip('"')
+    if boundary is None:
+        return []
+    files = []
+    for part in body.split(b'--' + boundary.encode('utf-8')):
+        headers, _, data = part.partition(b'\r\n\r\n')
+        disposition = [line for line in headers.split(b'\r\n') if line.lower().startswith(b'content-disposition')]
+        if len(disposition) == 0 or b'filename="' not in disposition[0]:
+            continue
+        filename = disposition[0].split(b'filename="')[1].split(b'"')[0].decode('utf-8')
+        files.append((filename, data[:-2] if data.endswith(b'\r\n') else data))
+    return files
+
+class IngestionStandIn:
+    def __init__(self, host='127.0.0.1', port=0):
+        # Status codes to answer the next requests with (e.g. [503, 429]), instead of handling them
+        self.statuses = []
+        # Retry-After header sent with those status codes
+        self.retry_after = None
+        # Answer with a failure every n-th request (0 never)
+        self.fail_every = 0
+        # filename -> number of times the file is reported as failed (-1 always)
+        self.fail_files = {}
+        # Whether file entries in the response have a fileName (otherwise they're matched on position)
+        self.file_names = True
+        # Every request: { 'path', 'headers', 'files' (list of file names), 'status' }
+        self.requests = []
+        # filename -> labels of every file that was stored
+        self.uploads = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def host(self):
+        # What to set EI_INGESTION_HOST to
+        return f'127.0.0.1:{self._server.server_address[1]}'
+
+    @property
+    def url(self):
+        return f'http://{self.host}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def _handle(self, path, headers, body):
+        # Returns (status, headers, body) for a request
+        files = parse_multipart(headers.get('Content-Type', ''), body)
+        with self._lock:
+            request = { 'path': path, 'headers': dict(headers), 'files': [filename for filename, _ in files] }
+            self.requests.append(request)
+            status = None
+            if len(self.statuses) > 0:
+                status = self.statuses.pop(0)
+            elif self.fail_every > 0 and len(self.requests) % self.fail_every == 0:
+                status = 503
+            if status is not None:
+                request['status'] = status
+                extra = { 'Retry-After': str(self.retry_after) } if self.retry_after is not None else {}
+                return status, extra, b'Service unavailable'
+            request['status'] = 200
+
+            if headers.get('x-api-key') is None:
+                return 401, {}, b'Missing x-api-key'
+            labels = {}
+            for filename, data in files:
+                if filename == 'bounding_boxes.labels':
+                    labels = json.loads(data.decode('utf-8'))['boundingBoxes']
+            if 'x-bounding-boxes' in headers:
+                labels = { filename: json.loads(headers['x-bounding-boxes']) for filename, _ in files }
+
+            entries = []
+            for filename, _ in files:
+                if filename == 'bounding_boxes.labels':
+                    continue
+                remaining = self.fail_files.get(filename, 0)
+                if remaining != 0:
+                    self.fail_files[filename] = remaining - 1 if remaining > 0 else remaining
+                    entry = { 'success': False, 'error': 'Rejected by the stand-in' }
+                else:
+                    self.uploads[filename] = labels.get(filename)
+                    entry = { 'success': True }
+                if self.file_names:
+                    entry['fileName'] = filename
+                entries.append(entry)
+        return 200, { 'Content-Type': 'application/json' }, json.dumps({ 'success': True, 'files': entries }).encode('utf-8')
+
+    def _handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                status, headers, out = stand_in._handle(self.path, self.headers, body)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stand-in for the Edge Impulse ingestion service')
+    parser.add_argument('--host', type=str, required=False, help="Address to listen on", default='127.0.0.1')
+    parser.add_argument('--port', type=int, required=False, help="Port to listen on", default=4810)
+    parser.add_argument('--fail-every', type=int, required=False, help="Answer every n-th request with a 503 (0 never)", default=0)
+    args = parser.parse_args()
+
+    stand_in = IngestionStandIn(args.host, args.port)
+    stand_in.fail_every = args.fail_every
+    print(f'Ingestion stand-in listening on http://{args.host}:{args.port}', flush=True)
+    try:
+        stand_in.serve_forever()
+    except KeyboardInterrupt:
+        pass
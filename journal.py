@@ -0,0 +1,114 @@
+import os
+import json
+import threading
+
+# Crash-safe label output. Instead of keeping every image's labels in memory until the end of the
+# job, a line is appended to a journal (JSON lines) in the output directory as soon as an image is
+# written, and another one when it has been uploaded:
+#
+#     {"type": "job", "epoch": 1700000000, "seed": 1234, "settings": "<hash of the job settings>"}
+#     {"type": "image", "index": 0, "files": [{"filename": "composite.1700000000.0.png", "objects": [...]}]}
+#     {"type": "uploaded", "filename": "composite.1700000000.0.png"}
+#
+# An image has a single file, or one file per tile when the composites are tiled (see tiles.py).
+# At the end of the job the journal is compacted into bounding_boxes.labels. If a job dies, the
+# journal tells a resumed job (--resume) which images are done and which still need uploading.
+
+JOURNAL_FILENAME = 'bounding_boxes.journal.jsonl'
+LABELS_FILENAME = 'bounding_boxes.labels'
+
+class JournalState:
+    def __init__(self):
+        self.header = None
+        # index -> [(filename, objects)]
+        self.images = {}
+        self.uploaded = set()
+
+def read_journal(path):
+    # Returns the JournalState, or None if there's no journal
+    if not os.path.exists(path):
+        return None
+    state = JournalState()
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A line that was cut off when the job died
+                continue
+            if entry.get('type') == 'job':
+                state.header = entry
+            elif entry.get('type') == 'image' and 'files' in entry:
+                state.images[entry['index']] = [(file['filename'], file['objects']) for file in entry['files']]
+            elif entry.get('type') == 'image':
+                # Journals from before tiling, with a single file per line
+                state.images[entry['index']] = [(entry['filename'], entry['objects'])]
+            elif entry.get('type') == 'uploaded':
+                state.uploaded.add(entry['filename'])
+    return state
+
+def trim_partial_line(path, chunk_size=65536):
+    # Cuts a line that was cut off when the job died from the end of the journal, so the next line
+    # isn't appended to it (read_journal would skip both)
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - chunk_size)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b'\n')
+            if newline >= 0:
+                position = start + newline + 1
+                break
+            position = start
+        if position < end:
+            f.truncate(position)
+
+class LabelJournal:
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, JOURNAL_FILENAME)
+        self._file = None
+        # Upload threads mark files as uploaded
+        self._lock = threading.Lock()
+
+    def open(self, header=None):
+        # Appends to an existing journal, a new job starts with its header
+        trim_partial_line(self.path)
+        self._file = open(self.path, 'a')
+        if header is not None:
+            self._write(dict({ 'type': 'job' }, **header))
+
+    def _write(self, entry):
+        with self._lock:
+            self._file.write(json.dumps(entry) + '\n')
+            # Flushed on every line, so a crashed job loses at most the image that was being written
+            self._file.flush()
+
+    def image(self, index, files):
+        # All files of an image go on a single line, so an image is either done or not
+        self._write({ 'type': 'image', 'index': index, 'files': [{ 'filename': filename, 'objects': objects } for filename, objects in files] })
+
+    def uploaded(self, filename):
+        self._write({ 'type': 'uploaded', 'filename': filename })
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def compact(self):
+        # Writes bounding_boxes.labels with every image in the journal (in image order), returns the labels
+        state = read_journal(self.path)
+        labels = {
+            "version": 1,
+            "type": "bounding-box-labels",
+            "boundingBoxes": { filename: objects for _, files in sorted(state.images.items()) for filename, objects in files }
+        }
+        path = os.path.join(self.directory, LABELS_FILENAME)
+        with open(path + '.tmp', 'w') as file:
+            json.dump(labels, file, indent = 4)
+        os.replace(path + '.tmp', path)
+        return labels
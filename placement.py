@@ -0,0 +1,99 @@
+import math
+import numpy as np
+
+# Placement of non-overlapping objects. The object area is covered by an occupancy grid where every
+# cell that a placed object touches is marked as taken. To place a new object, all positions where
+# it would only cover free cells are found at once (using a summed-area table of the grid) and one
+# of them is picked at random, so an object is only rejected when there really is no room left for
+# it. Cells are a single pixel for areas up to MAX_GRID_CELLS wide/high, larger areas use bigger
+# cells (which makes placement slightly conservative, objects can't share a cell).
+
+MAX_GRID_CELLS = 512
+
+class OccupancyGrid:
+    def __init__(self, left, top, width, height):
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+        self.cell_size = max(1, math.ceil(max(width, height) / MAX_GRID_CELLS))
+        self.occupied = np.zeros((math.ceil(height / self.cell_size), math.ceil(width / self.cell_size)), dtype=np.int32)
+        self._summed = None
+
+    def _cells(self, x, y, width, height):
+        # Range of cells covered by a box, clipped to the grid
+        c = self.cell_size
+        x1 = max(0, (x - self.left) // c)
+        y1 = max(0, (y - self.top) // c)
+        x2 = min(self.occupied.shape[1], (x - self.left + width - 1) // c + 1)
+        y2 = min(self.occupied.shape[0], (y - self.top + height - 1) // c + 1)
+        return x1, y1, x2, y2
+
+    def add(self, x, y, width, height):
+        x1, y1, x2, y2 = self._cells(x, y, width, height)
+        if x2 > x1 and y2 > y1:
+            self.occupied[y1:y2, x1:x2] = 1
+            self._summed = None
+
+    def is_free(self, x, y, width, height):
+        x1, y1, x2, y2 = self._cells(x, y, width, height)
+        return not self.occupied[y1:y2, x1:x2].any()
+
+    def sample(self, width, height, rng, first_fit=False):
+        # Returns a random (x, y) where a width x height object fits in the area without covering
+        # any occupied cells, or None if there is no such position. With first_fit the top-left
+        # most free position is used instead, which packs objects as tightly as possible
+        if width > self.width or height > self.height:
+            return None
+        c = self.cell_size
+        if self._summed is None:
+            self._summed = np.pad(self.occupied, ((1, 0), (1, 0))).cumsum(axis=0).cumsum(axis=1)
+
+        # Positions are a cell origin plus a jitter of up to cell_size - 1 pixels, so the object can
+        # cover one more cell than its size in cells
+        span_x = (width + 2 * c - 2) // c
+        span_y = (height + 2 * c - 2) // c
+        max_cx = min((self.width - width) // c, self.occupied.shape[1] - span_x)
+        max_cy = min((self.height - height) // c, self.occupied.shape[0] - span_y)
+        if max_cx < 0 or max_cy < 0:
+            return None
+
+        S = self._summed
+        taken = (S[span_y:span_y + max_cy + 1, span_x:span_x + max_cx + 1]
+                 - S[:max_cy + 1, span_x:span_x + max_cx + 1]
+                 - S[span_y:span_y + max_cy + 1, :max_cx + 1]
+                 + S[:max_cy + 1, :max_cx + 1])
+        free = np.flatnonzero(taken.ravel() == 0)
+        if len(free) == 0:
+            return None
+
+        if first_fit:
+            cy, cx = divmod(int(free[0]), max_cx + 1)
+            return self.left + cx * c, self.top + cy * c
+        cy, cx = divmod(int(free[rng.randrange(len(free))]), max_cx + 1)
+        x = self.left + cx * c + rng.randint(0, min(c - 1, self.width - width - cx * c))
+        y = self.top + cy * c + rng.randint(0, min(c - 1, self.height - height - cy * c))
+        return x, y
+
+class PlacementStats:
+    def __init__(self):
+        self.attempts = 0
+        self.rejected = 0
+        self.target = 0
+        self.placed = 0
+        # Objects cropped to the object area, and objects that didn't fit in it (without cropping)
+        self.cropped = 0
+        self.too_large = 0
+        # Tiles that weren't written because there was no object in them (see tiles.py)
+        self.empty_tiles = 0
+
+    def add(self, other):
+        # Sums the stats of many images
+        for name, value in vars(other).items():
+            setattr(self, name, getattr(self, name) + value)
+
+    def to_dict(self):
+        return dict(vars(self), dropped=self.target - self.placed)
+
+    def __str__(self):
+        return f'{self.attempts} placement attempts, {self.rejected} rejected'
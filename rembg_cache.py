@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import threading
+
+# Persistent cache for background removal results. Entries are keyed on a hash of the raw image
+# bytes together with everything else that changes the result (resize mode and parameters, rembg
+# model), so a changed source image or changed settings are never served from the cache. Each
+# entry is the cropped RGBA PNG plus a small JSON file with its bounding box in the resized raw
+# image. When the cache grows over its size limit the least recently used entries are removed.
+
+# Bump this when the way cached objects are produced changes, to invalidate existing entries
+CACHE_VERSION = 2
+
+class RembgCache:
+    def __init__(self, directory, max_size_mb=1024):
+        self.directory = directory
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        # The cache is shared by the threads that process raw objects
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, raw_bytes, params):
+        h = hashlib.sha256()
+        h.update(raw_bytes)
+        h.update(json.dumps({ 'version': CACHE_VERSION, 'params': params }, sort_keys=True).encode('utf-8'))
+        return h.hexdigest()
+
+    def _paths(self, key):
+        return os.path.join(self.directory, key + '.png'), os.path.join(self.directory, key + '.json')
+
+    def get(self, key):
+        # Returns (png_bytes, bbox) or None
+        png_path, info_path = self._paths(key)
+        try:
+            with open(png_path, 'rb') as f:
+                png_bytes = f.read()
+            with open(info_path, 'r') as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        # Mark the entry as recently used
+        try:
+            os.utime(png_path)
+            os.utime(info_path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return png_bytes, tuple(info['bbox'])
+
+    def put(self, key, png_bytes, bbox, params):
+        png_path, info_path = self._paths(key)
+        # Write to temporary files first so an interrupted job never leaves a half written entry
+        with open(png_path + '.tmp', 'wb') as f:
+            f.write(png_bytes)
+        with open(info_path + '.tmp', 'w') as f:
+            json.dump({ 'bbox': [int(v) for v in bbox], 'params': params }, f)
+        os.replace(png_path + '.tmp', png_path)
+        os.replace(info_path + '.tmp', info_path)
+        with self._lock:
+            self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.png'):
+                continue
+            key = filename[:-len('.png')]
+            png_path, info_path = self._paths(key)
+            try:
+                size = os.path.getsize(png_path) + os.path.getsize(info_path)
+                mtime = os.path.getmtime(png_path)
+            except OSError:
+                continue
+            entries.append((mtime, size, key))
+            total += size
+
+        # Remove the least recently used entries until the cache fits
+        for mtime, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            for path in self._paths(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+            self.evicted += 1
+
+    def summary(self):
+        return f'Background removal cache: {self.hits} hits, {self.misses} misses, {self.evicted} evicted ({self.directory})'
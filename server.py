@@ -0,0 +1,160 @@
+import sys
+import argparse
+import json
+import logging
+import threading
+import traceback
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import generator
+
+# Job server that runs many generation jobs in one process, so the decoded backgrounds and objects,
+# the rembg model and the fisheye lenses stay in memory between jobs (see generator.py). Changed
+# files in the composite directory are picked up by the next job (see assets.py).
+#
+# A job is a JSON object with the same parameters as transform.py, either as a list of arguments
+# or by name (without the leading dashes), plus an optional id that is sent back with every result:
+#
+#     {"id": 1, "params": {"composite-dir": "composites", "images": 10, ...}}
+#     {"id": 2, "args": ["--composite-dir", "composites", "--images", "10", ...]}
+#
+# Results are streamed back as JSON lines, one {"event": "image"} line for every image as soon as
+# it's written, then a single {"event": "done"} line with a summary of the job, or {"event": "error"}.
+#
+# HTTP mode (POST the job to /generate, GET /health to see if a job is running):
+#
+#     python3 server.py --port 4820
+#     curl -N -X POST localhost:4820/generate -d '{"params": {...}}'
+#
+# stdin mode (one job per line, results on stdout, the job log goes to stderr):
+#
+#     python3 server.py --stdin 1 < jobs.jsonl
+
+# The generator keeps module level state, so jobs run one at a time
+job_lock = threading.Lock()
+
+def job_argv(job):
+    if 'args' in job:
+        return [str(arg) for arg in job['args']]
+    argv = []
+    for name, value in job.get('params', {}).items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            value = int(value)
+        argv += ['--' + name.lstrip('-').replace('_', '-'), str(value)]
+    return argv
+
+def run_job(job, emit):
+    # Runs a single job, passing every result line to emit
+    job_id = job.get('id') if isinstance(job, dict) else None
+
+    def send(line):
+        if job_id is not None:
+            line['id'] = job_id
+        emit(line)
+
+    def on_image(filename, objects):
+        send({ 'event': 'image', 'filename': filename, 'objects': objects })
+
+    try:
+        if not isinstance(job, dict):
+            raise generator.GeneratorError('A job should be a JSON object')
+        config = generator.parse_config(job_argv(job), exit_on_error=False)
+        with job_lock:
+            result = generator.generate(config, on_image=on_image, preload_assets=True)
+    except generator.GeneratorError as e:
+        send({ 'event': 'error', 'message': str(e) })
+        return
+    except Exception as e:
+        # Keep serving after unexpected errors, the next job might be fine
+        print(traceback.format_exc(), file=sys.stderr)
+        send({ 'event': 'error', 'message': str(e) })
+        return
+
+    # The labels were already sent with every image
+    del result['labels']
+    send(dict({ 'event': 'done' }, **result))
+
+class JobHandler(BaseHTTPRequestHandler):
+    def send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path != '/health':
+            self.send_json(404, { 'error': 'Not found' })
+            return
+        self.send_json(200, { 'status': 'busy' if job_lock.locked() else 'idle' })
+
+    def do_POST(self):
+        if self.path != '/generate':
+            self.send_json(404, { 'error': 'Not found' })
+            return
+        try:
+            job = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        except ValueError as e:
+            self.send_json(400, { 'error': 'Invalid JSON: ' + str(e) })
+            return
+
+        # The response is streamed without a length, the connection is closed when the job is done
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+        connected = [True]
+
+        def emit(line):
+            if not connected[0]:
+                return
+            try:
+                self.wfile.write((json.dumps(line) + '\n').encode('utf-8'))
+                self.wfile.flush()
+            except OSError:
+                # The client went away, finish the job anyway (uploads are still running)
+                connected[0] = False
+
+        run_job(job, emit)
+
+def serve_stdin():
+    out = sys.stdout
+
+    def emit(line):
+        out.write(json.dumps(line) + '\n')
+        out.flush()
+
+    # Everything the jobs print goes to stderr, so stdout only has the results (forked workers
+    # inherit this as well)
+    with redirect_stdout(sys.stderr):
+        for line in sys.stdin:
+            if line.strip() == '':
+                continue
+            try:
+                job = json.loads(line)
+            except ValueError as e:
+                emit({ 'event': 'error', 'message': 'Invalid JSON: ' + str(e) })
+                continue
+            run_job(job, emit)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run composite image generation jobs in a long-running process')
+    parser.add_argument('--host', type=str, required=False, help="Address to listen on", default='127.0.0.1')
+    parser.add_argument('--port', type=int, required=False, help="Port to listen on", default=4820)
+    parser.add_argument('--stdin', type=int, required=False, help="If set to 1, reads jobs from stdin (one JSON object per line) instead of running an HTTP server", default=0)
+    args = parser.parse_args()
+    # The job log goes to stderr, in stdin mode stdout only has the results
+    logging.basicConfig(stream=sys.stderr, format='%(message)s')
+
+    if args.stdin:
+        serve_stdin()
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), JobHandler)
+        print(f'Listening on http://{args.host}:{args.port}', flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
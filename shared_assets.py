@@ -0,0 +1,145 @@
+import os
+import mmap
+import tempfile
+import numpy as np
+from multiprocessing import shared_memory
+
+# Shared asset store for worker processes (numpy engine). Without it every worker decodes the
+# backgrounds and objects it uses into its own memory, so the memory footprint grows with the
+# number of workers. Instead the main process decodes the images once and packs them into a single
+# arena, with an index of where each image is:
+#
+#     path -> (offset, shape, label)
+#
+# Workers attach to the arena when they start (see the pool initializer in generator.py) and read
+# the images as zero-copy, read-only NumPy views, so nothing is decoded or pickled in the workers.
+#
+# Images that are shared already aren't packed: the ones the main process has decoded (the forked
+# workers inherit them) and memory-mapped BMPs (their pages are in the page cache). Workers get
+# those from their own image cache. The arena counts against the --asset-cache-size budget, as
+# shared memory is charged to the container's memory like any other memory, and it's only created
+# when it fits (see plan).
+#
+# The arena is a POSIX shared memory block, or a memory-mapped temporary file when /dev/shm is too
+# small for it (Docker gives containers 64 MB by default). Either way the pages are shared by all
+# processes.
+
+# Images start on a cache line
+ALIGNMENT = 64
+
+def shm_free_bytes():
+    try:
+        stat = os.statvfs('/dev/shm')
+    except OSError:
+        return 0
+    return stat.f_bavail * stat.f_frsize
+
+class SharedAssets:
+    def __init__(self, kind, name, size, index, create=False, fallback=None):
+        # kind is 'shm' (name is the shared memory block) or 'file' (name is the path of the file).
+        # Images that aren't in the arena are read from the fallback image cache
+        self.kind = kind
+        self.size = size
+        self.index = index
+        self.owner = create
+        self.fallback = fallback
+        self._shm = None
+        if kind == 'shm':
+            if create:
+                self._shm = shared_memory.SharedMemory(create=True, size=max(1, size))
+            else:
+                try:
+                    # Python 3.13+, the main process owns the block and removes it
+                    self._shm = shared_memory.SharedMemory(name=name, track=False)
+                except TypeError:
+                    self._shm = shared_memory.SharedMemory(name=name)
+            self.name = self._shm.name
+            buffer = self._shm.buf
+        else:
+            if create:
+                fd, name = tempfile.mkstemp(prefix='composite-assets-', suffix='.bin')
+                os.ftruncate(fd, max(1, size))
+            else:
+                fd = os.open(name, os.O_RDWR)
+            self.name = name
+            try:
+                buffer = mmap.mmap(fd, max(1, size))
+            finally:
+                os.close(fd)
+        self._array = np.frombuffer(buffer, dtype=np.uint8)
+
+    @staticmethod
+    def plan(engine, images, assets):
+        # Where every image that isn't shared yet goes in the arena, returns (index, size). The
+        # layout comes from the image dimensions in the file headers, so the images can be decoded
+        # one at a time
+        index = {}
+        size = 0
+        for asset in assets:
+            if asset.path in index or images.peek(asset) is not None or images.map_bmp(asset) is not None:
+                continue
+            if asset.width is None:
+                shape = engine.view(images.get(asset)).shape
+            else:
+                # The numpy engine decodes every image to RGBA
+                shape = (asset.height, asset.width, 4)
+            index[asset.path] = (size, shape, asset.label)
+            size += (int(np.prod(shape)) + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+        return index, size
+
+    @classmethod
+    def create(cls, engine, images, assets, index, size):
+        # Packs the assets in the index (see plan) into a new arena
+        kind = 'shm' if shm_free_bytes() >= size else 'file'
+        store = cls(kind, None, size, index, create=True)
+        try:
+            for asset in assets:
+                if asset.path not in index:
+                    continue
+                offset, shape, _ = index[asset.path]
+                # Images are only decoded for the arena, so the main process doesn't keep a second copy
+                image = engine.view(engine.load(asset.path))
+                if image.shape != shape:
+                    raise ValueError(f'{asset.path} decoded to {image.shape}, expected {shape}')
+                store._view(offset, shape)[...] = image
+        except:
+            store.release()
+            raise
+        return store
+
+    @classmethod
+    def attach(cls, kind, name, size, index, fallback=None):
+        return cls(kind, name, size, index, fallback=fallback)
+
+    def location(self):
+        # What a worker needs to attach
+        return self.kind, self.name, self.size, self.index
+
+    def _view(self, offset, shape):
+        return self._array[offset:offset + int(np.prod(shape))].reshape(shape)
+
+    def get(self, asset):
+        # Same interface as ImageCache.get, the image is shared and must not be changed
+        if asset.path not in self.index:
+            return self.fallback.get(asset)
+        offset, shape, _ = self.index[asset.path]
+        image = self._view(offset, shape)
+        image.flags.writeable = False
+        return image
+
+    def __len__(self):
+        return len(self.index)
+
+    def release(self):
+        # Called by the main process when the workers are done
+        self._array = None
+        if self.kind == 'shm':
+            try:
+                self._shm.close()
+            except BufferError:
+                # Views are still around, the memory is freed once they are gone
+                pass
+            if self.owner:
+                self._shm.unlink()
+        elif self.owner:
+            os.remove(self.name)
@@ -0,0 +1,58 @@
+import math
+
+# Tiled output for large backgrounds. Composites are still made at full resolution, but instead of
+# the whole composite a number of training sized tiles are written, each one cut from the composite
+# at one of the tile scales and resized to the tile size (a scale of 0.5 cuts a region twice the
+# tile size and halves it). The bounding boxes are clipped to every tile and moved into its
+# coordinates (see boxes.crop_boxes).
+#
+# With a number of tiles per composite the tiles are cut at random positions (and scales), with 0
+# the composite is covered by a grid of tiles at every scale, spread evenly so the last row and
+# column line up with the edges of the composite.
+
+def parse_tile_size(value):
+    # "640" or "640x480", returns (width, height)
+    parts = value.lower().split('x')
+    if len(parts) == 1:
+        parts = parts * 2
+    width, height = int(parts[0]), int(parts[1])
+    if width <= 0 or height <= 0:
+        raise ValueError('tile size should be positive')
+    return width, height
+
+def parse_tile_scales(value):
+    scales = [float(scale) for scale in value.split(',')]
+    if len(scales) == 0 or any(scale <= 0 for scale in scales):
+        raise ValueError('tile scales should be positive')
+    return scales
+
+def region_size(width, height, tile_width, tile_height, scale):
+    # Size of the region a tile is cut from, and the size of the tile. Regions never reach outside
+    # the composite, so a tile can be smaller than the tile size when the composite is too small
+    region_width = min(width, int(round(tile_width / scale)))
+    region_height = min(height, int(round(tile_height / scale)))
+    return region_width, region_height, max(1, int(round(region_width * scale))), max(1, int(round(region_height * scale)))
+
+def grid_positions(length, region_length):
+    count = max(1, math.ceil(length / region_length))
+    if count == 1:
+        return [0]
+    return [int(round(index * (length - region_length) / (count - 1))) for index in range(count)]
+
+def tile_regions(width, height, tile_width, tile_height, scales, count, rng):
+    # Returns (x, y, region width, region height, tile width, tile height) for every tile
+    regions = []
+    if count == 0:
+        for scale in scales:
+            region_width, region_height, out_width, out_height = region_size(width, height, tile_width, tile_height, scale)
+            for y in grid_positions(height, region_height):
+                for x in grid_positions(width, region_width):
+                    regions.append((x, y, region_width, region_height, out_width, out_height))
+        return regions
+    for _ in range(count):
+        scale = scales[rng.randrange(len(scales))]
+        region_width, region_height, out_width, out_height = region_size(width, height, tile_width, tile_height, scale)
+        x = rng.randint(0, width - region_width)
+        y = rng.randint(0, height - region_height)
+        regions.append((x, y, region_width, region_height, out_width, out_height))
+    return regions
@@ -0,0 +1,56 @@
+import time
+from contextlib import contextmanager
+
+# Accumulates the time spent in each stage of the pipeline, e.g.
+#
+#     with timer.stage('compositing'):
+#         ...
+#
+# Timers from worker processes are merged into the main one with merge(timer.to_dict()).
+class StageTimer:
+    def __init__(self):
+        self.seconds = {}
+        self.counts = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds, count=1):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + count
+
+    def merge(self, stages):
+        for name, stage in stages.items():
+            self.add(name, stage['seconds'], stage['count'])
+
+    def to_dict(self):
+        return { name: { 'seconds': self.seconds[name], 'count': self.counts[name] } for name in self.seconds }
+
+@contextmanager
+def profile(path, profiler='cprofile'):
+    # Profiles the block and writes the result to path, cProfile stats (open with pstats or snakeviz)
+    # or a pyinstrument HTML report
+    if profiler == 'pyinstrument':
+        from pyinstrument import Profiler
+        instrument = Profiler()
+        instrument.start()
+        try:
+            yield
+        finally:
+            instrument.stop()
+            with open(path, 'w') as file:
+                file.write(instrument.output_html())
+    else:
+        import cProfile
+        stats = cProfile.Profile()
+        stats.enable()
+        try:
+            yield
+        finally:
+            stats.disable()
+            stats.dump_stats(path)